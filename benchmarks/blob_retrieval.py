@@ -0,0 +1,60 @@
+"""Compares per-file ``git show`` retrieval with the persistent ``git cat-file --batch`` BlobReader.
+
+Usage: python benchmarks/blob_retrieval.py <repo_path> [--commits N]
+"""
+import argparse
+import time
+
+from git import Repo
+
+from pyref.repomanager.blob_reader import BlobReader
+
+
+def _modified_python_items(repo, max_commits):
+    items = list()
+    for commit in repo.iter_commits(max_count=max_commits):
+        if len(commit.parents) == 1:
+            for item in commit.diff(commit.parents[0]).iter_change_type('M'):
+                if item.a_path.endswith('.py'):
+                    items.append((commit, item))
+    return items
+
+
+def _time_git_show(repo, items):
+    start = time.perf_counter()
+    for commit, item in items:
+        repo.git.show(f'{commit.parents[0].hexsha}:{item.a_path}')
+        repo.git.show(f'{commit.hexsha}:{item.a_path}')
+    return time.perf_counter() - start
+
+
+def _time_blob_reader(repo, items):
+    start = time.perf_counter()
+    with BlobReader(repo) as blob_reader:
+        for _, item in items:
+            blob_reader.read_pair(item)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', help='path of the git repository to read from')
+    parser.add_argument('--commits', type=int, default=500, help='number of commits to walk from HEAD')
+    args = parser.parse_args()
+
+    repo = Repo(args.path)
+    items = _modified_python_items(repo, args.commits)
+    blobs = 2 * len(items)
+
+    show_time = _time_git_show(repo, items)
+    reader_time = _time_blob_reader(repo, items)
+
+    print(f'{blobs} blobs from {len(items)} modified .py files')
+    print(f'git show:    {show_time:8.3f}s ({blobs / show_time if show_time else 0:10.1f} blobs/s)')
+    print(f'BlobReader:  {reader_time:8.3f}s ({blobs / reader_time if reader_time else 0:10.1f} blobs/s)')
+    if reader_time:
+        print(f'speed-up:    {show_time / reader_time:8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+import argparse
+
+from pyref.preprocessing.diff_list import build_diff_lists_args
+from pyref.repomanager.repo_changes import repo_changes_args
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='pyref',
+                                     description='Detects refactorings in the history of Python projects.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    repo_changes = subparsers.add_parser('repochanges', help='Mine the modified Python files of a repository.')
+    repo_changes.add_argument('-p', '--path', required=True, help='Path to the git repository.')
+    repo_changes.add_argument('-l', '--lastcommit', action='store_true', help='Mine the last commit only.')
+    repo_changes.add_argument('-a', '--allcommits', action='store_true', help='Mine every single-parent commit.')
+    repo_changes.add_argument('-w', '--workers', type=int, default=1,
+                              help='Number of processes mining commits with --allcommits (default: 1).')
+    repo_changes.add_argument('--resume', action='store_true',
+                              help='With --allcommits, skip the commits already mined into the changes directory.')
+    repo_changes.set_defaults(func=repo_changes_args)
+
+    get_refs = subparsers.add_parser('getrefs', help='Detect the refactorings of the mined commits of a repository.')
+    get_refs.add_argument('-r', '--repopath', required=True, help='Path to the repository mined with repochanges.')
+    get_refs.add_argument('-d', '--directory', nargs='+',
+                          help='Only look at the changed files under these directories, or at these files.')
+    get_refs.add_argument('-s', '--skip', help='Minutes after which the detection of a commit is abandoned.')
+    get_refs.add_argument('-o', '--output',
+                          help='Directory of the refactoring JSON files (default: the refactorings directory of the '
+                               'repository).')
+    get_refs.add_argument('--resume', action='store_true',
+                          help='Skip the commits whose refactorings are already written for the same change file.')
+    get_refs.set_defaults(func=build_diff_lists_args)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+import pathlib
+import queue
+import threading
+
+from git import Repo
+
+from pyref.preprocessing.ast_cache import AstCache
+from pyref.preprocessing.diff_list import get_refactorings_from_changed_files, output_refactorings_to_json
+from pyref.repomanager.blob_reader import BlobReader
+from pyref.repomanager.change_store import commit_changes_path, write_commit_changes
+from pyref.repomanager.repo_changes import commit_changed_files, repository_commits
+
+
+def _put(changes_queue, item, stop):
+    while not stop.is_set():
+        try:
+            changes_queue.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def _read_changes(git_dir, hexshas, changes_directory, changes_queue, stop):
+    # The reader thread opens its own Repo: GitPython objects must not be shared between threads.
+    try:
+        repo = Repo(git_dir)
+        with BlobReader(repo) as blob_reader:
+            for hexsha in hexshas:
+                if stop.is_set():
+                    return
+                changed_files = commit_changed_files(repo.commit(hexsha), blob_reader)
+                if changes_directory is not None:
+                    write_commit_changes(commit_changes_path(changes_directory, hexsha), changed_files)
+                _put(changes_queue, changed_files, stop)
+    except Exception as e:
+        _put(changes_queue, e, stop)
+
+
+def iter_refactorings(repo, revs=None, changes_directory=None, project_refactorings_dir=None, directory=None,
+                      skip_time=None, ast_cache=None, queue_size=16, since=None, until=None, paths=None,
+                      skip_unchanged_methods=False):
+    """Yields ``(commit, refactorings)`` for the single-parent commits of ``revs``, in order, without going to disk.
+
+    ``revs`` is None for the whole history, a revision or range string understood by ``git rev-list``, or an iterable
+    of commits or SHAs; ``since``, ``until`` and ``paths`` narrow the selection as in ``repository_commits``.
+
+    A background thread reads the changed files of the next commits from git while the current one is detected; at
+    most ``queue_size`` commits are buffered between the two. Change files and refactoring JSON files are only written
+    when ``changes_directory`` and ``project_refactorings_dir`` are given. ``skip_unchanged_methods`` is passed on to
+    ``get_refactorings_from_changed_files``.
+    """
+    if revs is None or isinstance(revs, str):
+        commits = repository_commits(repo, rev=revs, since=since, until=until, paths=paths)
+    else:
+        commits = repository_commits(repo, revs, since=since, until=until, paths=paths)
+    commits = [commit for commit in commits if len(commit.parents) == 1]
+    _ast_cache = AstCache() if ast_cache is None else ast_cache
+
+    if project_refactorings_dir is not None:
+        pathlib.Path(project_refactorings_dir).mkdir(parents=True, exist_ok=True)
+
+    changes_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    reader = threading.Thread(
+        target=_read_changes,
+        args=(repo.git_dir, [commit.hexsha for commit in commits], changes_directory, changes_queue, stop),
+        daemon=True)
+    reader.start()
+
+    try:
+        for commit in commits:
+            changed_files = changes_queue.get()
+            if isinstance(changed_files, Exception):
+                raise changed_files
+
+            refactorings = get_refactorings_from_changed_files(changed_files, commit.hexsha, directory, skip_time,
+                                                               _ast_cache, skip_unchanged_methods)
+            if project_refactorings_dir is not None:
+                output_refactorings_to_json(commit.hexsha, refactorings, project_refactorings_dir)
+
+            yield commit, refactorings
+    finally:
+        stop.set()
+        reader.join()
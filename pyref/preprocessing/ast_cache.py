@@ -0,0 +1,70 @@
+import os
+import pathlib
+import pickle
+from collections import OrderedDict
+
+
+class AstCache:
+    """Parsed module ASTs keyed by git blob SHA.
+
+    A blob is usually the current side of one commit and the old side of the next, so it only has to be parsed once.
+    At most ``max_entries`` trees are kept in memory, evicting the least recently used one. When ``directory`` is set
+    every parsed tree is also pickled there, which lets later runs and other worker processes reuse it.
+    """
+
+    def __init__(self, max_entries=256, directory=None):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+        if directory is not None:
+            pathlib.Path(directory).mkdir(parents=True, exist_ok=True)
+
+    def get(self, blob_sha, parse):
+        """Returns the tree of ``blob_sha``, calling ``parse()`` to build it if it is not cached."""
+        if blob_sha in self._entries:
+            self._entries.move_to_end(blob_sha)
+            self.hits += 1
+            return self._entries[blob_sha]
+
+        tree = self._load(blob_sha)
+        if tree is None:
+            self.misses += 1
+            tree = parse()
+            self._store(blob_sha, tree)
+        else:
+            self.hits += 1
+
+        self._entries[blob_sha] = tree
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return tree
+
+    def _file_path(self, blob_sha):
+        return f'{self.directory}{os.sep}{blob_sha[:2]}{os.sep}{blob_sha[2:]}.pickle'
+
+    def _load(self, blob_sha):
+        if self.directory is None:
+            return None
+        try:
+            with open(self._file_path(blob_sha), 'rb') as cache_file:
+                return pickle.load(cache_file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def _store(self, blob_sha, tree):
+        if self.directory is None:
+            return
+        file_path = self._file_path(blob_sha)
+        pathlib.Path(file_path).parent.mkdir(parents=True, exist_ok=True)
+        # Written under a unique name then renamed, so concurrent workers never read a partial pickle.
+        temporary_path = f'{file_path}.{os.getpid()}.tmp'
+        try:
+            with open(temporary_path, 'wb') as cache_file:
+                pickle.dump(tree, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        except RecursionError:  # pathologically deep trees stay memory-only
+            os.remove(temporary_path)
+            return
+        os.replace(temporary_path, file_path)
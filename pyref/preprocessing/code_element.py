@@ -1,11 +1,12 @@
+from collections import Counter
 from dataclasses import dataclass, field
 import ast
 import astunparse
-import editdistance
 from pyref.preprocessing.diff_code_element import DiffModule, DiffClass
+from pyref.preprocessing.edit_distance import edit_distance
 from pyref.preprocessing.node_transformer import nodeReplace
 from pyref.preprocessing.utils import get_statement_elements, to_tree, get_expression_elements, different_code_element, \
-    ast_to_str, ast_comp_to_str, final_leaf, get_stmts_recursive
+    ast_to_str, ast_comp_to_str, final_leaf, get_stmts_recursive, copy_ast
 
 from ast import *
 
@@ -44,6 +45,9 @@ class Module:
         return DiffModule(classes_matched, classes_added, classes_removed, classes_difference,
                           methods_matched, methods_added, methods_removed)
 
+    def key(self):
+        return self.name
+
     def __eq__(self, other):
         if self.name == other.name:
             return True
@@ -71,6 +75,10 @@ class Class:
 
         return DiffClass(methods_matched, methods_added, methods_removed)
 
+    def key(self):
+        """Hashable counterpart of ``__eq__``."""
+        return self.name, self.module.key(), self.parent_method
+
     def __eq__(self, other):
         if self.name == other.name and self.module == other.module and self.parent_method == other.parent_method:
             return True
@@ -87,45 +95,71 @@ class Method:
     composite_statements: list = field(init=False)
     argsToParams: list = field(init=False)
     method_ast: ast.AST
+    unchanged: bool = field(init=False)
 
     def __post_init__(self):
         self.leaf_statements = []
         self.composite_statements = []
         self.argsToParams = []
+        self.unchanged = False  # set for stubs of methods identical in both revisions, which hold no statements
         self.position = self.method_ast.lineno
+        self._return_type = None
+        self._call_sites = None
+        self._all_stmts = None
+        self._stmt_counts = None
 
     def add_statement(self, statement):
         if type(statement).__name__ == "Statement":
             self.leaf_statements.append(statement)
         elif type(statement).__name__ == "CompositeStatement":
             self.composite_statements.append(statement)
+        self._all_stmts = None
+        self._stmt_counts = None
 
     def return_type(self):
+        if self._return_type is not None:
+            return self._return_type
+
         return_nodes = []
 
         for child in ast.iter_child_nodes(self.method_ast):
             if type(child).__name__ == "Subscript":
                 for element in get_statement_elements(to_tree(child)):
                     return_nodes.extend(ast.dump(element.name))
+        self._return_type = return_nodes
         return return_nodes
 
     def get_total_stmts_count(self):
         return len(self.get_all_stmts())
 
+    def call_sites(self):
+        """Calls made by the method, by callee name, in statement order and ``ast.walk`` order within a statement."""
+        if self._call_sites is None:
+            self._call_sites = {}
+            for statement in self.get_all_stmts():
+                for element in ast.walk(statement.ast_node):
+                    if type(element).__name__ == "Call":
+                        callee = astunparse.unparse(element.func)[0:-1].split(".")[-1]
+                        self._call_sites.setdefault(callee, []).append(element)
+        return self._call_sites
+
     def calls(self, method):
-        for statement in self.get_all_stmts():
-            for element in ast.walk(statement.ast_node):
-                if type(element).__name__ == "Call":
-                    # print(self.name, method.name, astunparse.unparse(element.func)[0:-1].split(".")[-1])
-                    if method.name == astunparse.unparse(element.func)[0:-1].split(".")[-1]:
-                        return True
-        return False
+        return method.name in self.call_sites()
 
     def get_all_stmts(self):
-        _stmts = []
-        for compo in self.composite_statements:
-            _stmts.extend(get_stmts_recursive(compo))
-        return self.leaf_statements + list(_stmts) + self.composite_statements
+        """Leaf statements, statements nested in composites, then composites, as a tuple built once."""
+        if self._all_stmts is None:
+            _stmts = []
+            for compo in self.composite_statements:
+                _stmts.extend(get_stmts_recursive(compo))
+            self._all_stmts = tuple(self.leaf_statements + _stmts + self.composite_statements)
+        return self._all_stmts
+
+    def get_stmt_counts(self):
+        """Number of statements of the method by statement string."""
+        if self._stmt_counts is None:
+            self._stmt_counts = Counter(str(stmt) for stmt in self.get_all_stmts())
+        return self._stmt_counts
 
     def get_path(self):
         if not (self.class_node is None):
@@ -137,6 +171,11 @@ class Method:
             return "from the module " + self.module.name + " in class " + self.class_node.name
         return "from the module " + self.module.name
 
+    def key(self):
+        """Hashable counterpart of ``__eq__``, which only compares methods of the same kind (in a class or not)."""
+        return self.name, tuple(self.params), self.module.name, tuple(self.return_type()), \
+            None if self.class_node is None else self.class_node.name
+
     def __eq__(self, obj):
         if self.name == obj.name and self.params == obj.params and self.module.name == obj.module.name and \
                 self.return_type() == obj.return_type():
@@ -158,53 +197,79 @@ class Statement:
 
     def __post_init__(self):
         self.processed_ast_node = None
+        self._tree = None
+        self._processed_tree = None
+        self._str = None
+        self._processed_str = None
+
+    def get_tree(self):
+        if self._tree is None:
+            self._tree = to_tree(self.ast_node)
+        return self._tree
+
+    def get_processed_tree(self):
+        if self._processed_tree is None:
+            self._processed_tree = to_tree(self.processed_ast_node)
+        return self._processed_tree
 
     def get_ast_node(self):
-        return eval(ast.dump(self.ast_node))
+        return copy_ast(self.ast_node)
 
     def get_processed_ast_node(self):
-        return eval(ast.dump(self.processed_ast_node))
+        return copy_ast(self.processed_ast_node)
 
     def set_processed_ast_node(self, ast_node):
         self.processed_ast_node = ast_node
+        # also dropped for the same node, which may have been rewritten in place
+        self._processed_tree = None
+        self._processed_str = None
 
-    def replace_and_distance(self, leaf2, element1=None, element2=None, df_replacements=None):
+    def replace_and_distance(self, leaf2, element1=None, element2=None, replacements=None, bound=None):
         copy_process_leaf = self.get_processed_ast_node()
 
-        if not (df_replacements is None):
-            processed_ast_elements = get_statement_elements(to_tree(self.processed_ast_node))
-            df_replacements.apply(lambda row: final_leaf(copy_process_leaf, self.processed_ast_node, row, processed_ast_elements), axis=1)
-            distance = editdistance.eval(ast_to_str(copy_process_leaf), ast_to_str(leaf2.get_processed_ast_node()))
+        if not (replacements is None):
+            processed_ast_elements = get_statement_elements(self.get_processed_tree())
+            for row in replacements:
+                final_leaf(copy_process_leaf, self.processed_ast_node, row, processed_ast_elements)
+            distance = edit_distance(ast_to_str(copy_process_leaf), ast_to_str(leaf2.get_processed_ast_node()), bound)
         else:
             nodeReplace(element1.name, element2.name, copy_process_leaf, self.processed_ast_node,
                         element1.parent).visit(copy_process_leaf)
 
-            distance = editdistance.eval(ast_to_str(copy_process_leaf), ast_to_str(leaf2.get_processed_ast_node()))
+            distance = edit_distance(ast_to_str(copy_process_leaf), ast_to_str(leaf2.get_processed_ast_node()), bound)
 
         return distance
 
     def get_original_elements(self):
-        return get_statement_elements(to_tree(self.ast_node))
+        return get_statement_elements(self.get_tree())
 
     def get_elements(self):
         if self.processed_ast_node is None:
-            return get_statement_elements(to_tree(self.ast_node))
-        return get_statement_elements(to_tree(self.processed_ast_node))
+            return get_statement_elements(self.get_tree())
+        return get_statement_elements(self.get_processed_tree())
 
     def ast_type(self):
         return type(self.ast_node).__name__
 
-    def get_distance(self, leaf):
-        str_leaf1 = ast_to_str(self.processed_ast_node)
-        str_leaf2 = ast_to_str(leaf.processed_ast_node)
-        replace_distance = editdistance.eval(str_leaf1, str_leaf2)
+    def to_str(self, ast_node):
+        return ast_to_str(ast_node)
+
+    def get_distance(self, leaf, bound=None):
+        """Edit distance of the processed statements, only exact up to ``bound`` when one is given."""
+        str_leaf1 = self.get_processed_ast_node_str()
+        str_leaf2 = leaf.get_processed_ast_node_str()
+        replace_distance = edit_distance(str_leaf1, str_leaf2, bound)
         return replace_distance
 
     def __str__(self):
-        return ast_to_str(self.ast_node)
+        if self._str is None:
+            self._str = self.to_str(self.ast_node)
+        return self._str
 
     def get_processed_ast_node_str(self):
-        return ast_to_str(self.processed_ast_node)
+        if self._processed_str is None:
+            self._processed_str = self.to_str(self.processed_ast_node)
+        return self._processed_str
 
     def __eq__(self, other):
         if str(self) == str(other):
@@ -222,6 +287,10 @@ class CompositeStatement(Statement):
         self.leaf_statements = []
         self.composite_statements = []
         self.processed_ast_node = None
+        self._tree = None
+        self._processed_tree = None
+        self._str = None
+        self._processed_str = None
 
     # def get_processed_ast_node(self):
     #     _processed_ast_node = eval(ast.dump(self.processed_ast_node))
@@ -236,45 +305,37 @@ class CompositeStatement(Statement):
 
     def get_elements(self):
         if self.processed_ast_node is None:
-            tree = to_tree(self.ast_node)
-            return get_expression_elements(tree)
-        tree = to_tree(self.processed_ast_node)
-        return get_expression_elements(tree)
+            return get_expression_elements(self.get_tree())
+        return get_expression_elements(self.get_processed_tree())
 
     def get_all_stmts(self):
         return self.leaf_statements + self.composite_statements
 
     def is_identical(self, ast_node):
-        ast_node1 = ast_comp_to_str(self.ast_node)
+        ast_node1 = str(self)
         ast_node2 = ast_comp_to_str(ast_node)
         if ast_node1 == ast_node2:
             return True
         return False
 
-    def replace_and_distance(self, leaf2, element1=None, element2=None, df_replacements=None):
+    def replace_and_distance(self, leaf2, element1=None, element2=None, replacements=None, bound=None):
         copy_process_leaf = self.get_processed_ast_node()
 
-        if not (df_replacements is None):
+        if not (replacements is None):
             # print(ast_to_str(copy_process_leaf), ast_to_str(leaf2.get_processed_ast_node()))
-            processed_ast_elements = get_expression_elements(to_tree(self.processed_ast_node))
-            df_replacements.apply(lambda row: final_leaf(copy_process_leaf, self.processed_ast_node, row,processed_ast_elements), axis=1)
-            distance = editdistance.eval(ast_comp_to_str(copy_process_leaf), ast_comp_to_str(leaf2.get_processed_ast_node()))
+            processed_ast_elements = get_expression_elements(self.get_processed_tree())
+            for row in replacements:
+                final_leaf(copy_process_leaf, self.processed_ast_node, row, processed_ast_elements)
+            distance = edit_distance(ast_comp_to_str(copy_process_leaf),
+                                     ast_comp_to_str(leaf2.get_processed_ast_node()), bound)
         else:
             nodeReplace(element1.name, element2.name, copy_process_leaf, self.processed_ast_node,
                         element1.parent).visit(copy_process_leaf)
-            distance = editdistance.eval(ast_comp_to_str(copy_process_leaf), ast_comp_to_str(leaf2.get_processed_ast_node()))
+            distance = edit_distance(ast_comp_to_str(copy_process_leaf),
+                                     ast_comp_to_str(leaf2.get_processed_ast_node()), bound)
 
         # self.set_processed_ast_node(old_process_leaf)
         return distance
 
-    def get_distance(self, leaf):
-        str_leaf1 = ast_comp_to_str(self.processed_ast_node)
-        str_leaf2 = ast_comp_to_str(leaf.processed_ast_node)
-        replace_distance = editdistance.eval(str_leaf1, str_leaf2)
-        return replace_distance
-
-    def get_processed_ast_node_str(self):
-        return ast_comp_to_str(self.processed_ast_node)
-
-    def __str__(self):
-        return ast_comp_to_str(self.ast_node)
+    def to_str(self, ast_node):
+        return ast_comp_to_str(ast_node)
@@ -1,14 +1,45 @@
 import ast
+from collections import Counter
+
 import astunparse
 import editdistance
 from pyref.preprocessing.node_transformer import nodeReplace, replaceProt
-import pandas as pd
 
 from pyref.preprocessing.refactorings_info import RefInfo
-from pyref.preprocessing.utils import get_node_index
-
-
-def body_mapper(methods1, method2, heuristic_info):
+from pyref.preprocessing.statement_matches import StatementMatch, StatementMatches
+from pyref.preprocessing.utils import get_node_index, node_to_str, copy_ast
+
+_ABSTRACT_NODES = ["Return", "Raise", "Assert"]
+
+
+class MatchMemo:
+    """body_mapper results and statement pair matches of one commit, keyed by element and argsToParams context."""
+
+    def __init__(self):
+        self.mappings = {}
+        self.pairs = {}
+        self.forms = {}
+        self.mapping_hits = 0
+        self.mapping_misses = 0
+        self.pair_hits = 0
+        self.pair_misses = 0
+        self.pruning_pairs = 0
+        self.pruned_by_type = 0
+        self.pruned_by_elements = 0
+        self._contexts = {}  # id of an argsToParams list -> (the list, its context number)
+        self._context_numbers = {}
+
+    def context(self, method):
+        args_to_params = method.argsToParams
+        entry = self._contexts.get(id(args_to_params))
+        if entry is None or entry[0] is not args_to_params:
+            context_key = tuple((param, ast.dump(arg)) for param, arg in args_to_params)
+            entry = (args_to_params, self._context_numbers.setdefault(context_key, len(self._context_numbers)))
+            self._contexts[id(args_to_params)] = entry
+        return entry[1]
+
+
+def body_mapper(methods1, method2, heuristic_info, memo=None):
     if heuristic_info is RefInfo.RENAME:
         method1 = methods1
     elif heuristic_info is RefInfo.EXTRACT:
@@ -20,135 +51,138 @@ def body_mapper(methods1, method2, heuristic_info):
         method3 = methods1[0]
         argsToParams = get_args_to_params(method3, method2)
 
-    matched_statements = pd.DataFrame(
-        columns=['stmt1', 's1Index', 'stmt2', 's2Index', 'type', 'distance', 'depth_diff', 'index_diff',
-                 "replacements"])
+    memo = MatchMemo() if memo is None else memo
+    key = (id(method1), memo.context(method1), id(method2), memo.context(method2))
+    if key in memo.mappings:
+        memo.mapping_hits += 1
+        return memo.mappings[key]
+    memo.mapping_misses += 1
 
-    i = 0
-
-    matched_statements = statements_match(method1.get_all_stmts(), method2.get_all_stmts(), matched_statements, i)
+    matched_statements = statements_match(method1.get_all_stmts(), method2.get_all_stmts(), memo)
 
-    matched_statements = matched_statements[~(matched_statements.type.str.contains("inner"))]
+    if len(matched_statements) > 0:
+        matched_statements = matched_statements.best_by(lambda match: (match.stmt1, match.s1Index))
+        matched_statements = matched_statements.best_by(lambda match: (match.stmt2, match.s2Index))
 
-    if len(matched_statements.index) > 0:
-        gp = matched_statements.groupby(['stmt1', 's1Index'])
+    memo.mappings[key] = matched_statements
+    return matched_statements
 
-        toKeep = []
 
-        for name, group in gp:
-            toKeep.append(
-                group.sort_values(['distance', 'depth_diff', 'index_diff'], ascending=[True, True, True]).iloc[0])
+def statements_match(statements1, statements2, memo=None):
+    memo = MatchMemo() if memo is None else memo
 
-        matched_statements = pd.DataFrame(toKeep)  # FURTHER CHECK
+    statements2_by_str = {}
+    for statement2 in statements2:
+        statements2_by_str.setdefault(str(statement2), []).append(statement2)
 
-        toKeep = []
+    # body_mapper keeps the best match of each (stmt1, s1Index): a match with an equal statement has distance 0 and
+    # ranks before any other, so once one is found, only the equal statements are matched for that key
+    exact_keys = set()
+    for statement1 in statements1:
+        for statement2 in statements2_by_str.get(str(statement1), []):
+            if _match_pair(statement1, statement2, memo)[0]:
+                exact_keys.add((str(statement1), statement1.index))
 
-        gp = matched_statements.groupby(['stmt2', 's2Index'])
+    matches = []
+    for statement1 in statements1:
+        if (str(statement1), statement1.index) in exact_keys:
+            candidates = statements2_by_str[str(statement1)]
+        else:
+            candidates = statements2
+        for statement2 in candidates:
+            identical, reps = _match_pair(statement1, statement2, memo)
+            if identical:
+                _type = "leaf" if type(statement1).__name__ == "Statement" else "compo"
+                matches.append(_statement_match(statement1, statement2, _type, reps))
 
-        for name, group in gp:
-            toKeep.append(
-                group.sort_values(['distance', 'depth_diff', 'index_diff'], ascending=[True, True, True]).iloc[0])
-        return pd.DataFrame(toKeep)
+    return StatementMatches(matches)
 
-    return matched_statements
 
+def inner_statements_match(statements1, statements2, memo=None):
+    """Whether any pair of the inner statements of two composites is matched, as statements_match would match them.
 
-def statements_match(statements1, statements2, matched_statements, i, _type=""):
+    Matches of inner statements only decide whether their composites may be matched: methods' statements already
+    include the inner ones, so the first match found is enough.
+    """
+    memo = MatchMemo() if memo is None else memo
     for statement1 in statements1:
         for statement2 in statements2:
-            if type(statement1).__name__ == "Statement" and type(statement2).__name__ == "Statement":
-                identical, reps = process_leaf(statement1, statement2)
-                if identical:
-                    if reps is not None:
-                        reps = reps.to_dict()
-                    matched_statements = matched_statements.append(
-                        {"stmt1": str(statement1), 's1Index': statement1.index, "s1Lineno": statement1.ast_node.lineno, "stmt2": str(statement2),
-                         's2Index': statement2.index,
-                         "type": _type + "leaf",
-                         "distance": editdistance.eval(str(statement1),
-                                                       str(statement2)),
-                         "depth_diff": abs(
-                             statement1.depth - statement2.depth),
-                         "index_diff": abs(
-                             statement1.index - statement2.index),
-                         "replacements": reps
-                         },
-                        ignore_index=True)
-
-            elif type(statement1).__name__ == "CompositeStatement" and type(
-                    statement2).__name__ == "CompositeStatement":
-                compo_matched_statements = pd.DataFrame(
-                    columns=['stmt1', 's1Index', 's1Lineno', 'stmt2', 's2Index', 'type', 'distance', 'depth_diff', 'index_diff',
-                             "replacements"])
-                # matched_statements = {}
-                compo_matched_statements = statements_match(statement1.get_all_stmts(),
-                                                            statement2.get_all_stmts(), compo_matched_statements, i,
-                                                            "inner")
-                if len(compo_matched_statements.index) > 0:
-                    identical, reps = process_leaf(statement1, statement2)
-                    if identical:
-                        if reps is not None:
-                            reps = reps.to_dict()
-                        matched_statements = matched_statements.append(
-                            {"stmt1": str(statement1), 's1Index': statement1.index, "s1Lineno": statement1.ast_node.lineno, "stmt2": str(statement2),
-                             's2Index': statement2.index,
-                             "type": _type + "compo",
-                             "distance": editdistance.eval(str(statement1),
-                                                           str(statement2)),
-                             "depth_diff": abs(
-                                 statement1.depth - statement2.depth),
-                             "index_diff": abs(
-                                 statement1.index - statement2.index),
-                             "replacements": reps
-                             },
-                            ignore_index=True)
-                        matched_statements = matched_statements.append(compo_matched_statements, ignore_index=True)
+            if _match_pair(statement1, statement2, memo)[0]:
+                return True
+    return False
 
-    return matched_statements
 
+def _match_pair(statement1, statement2, memo):
+    """process_leaf of two leaves, or of two composites with matched inner statements; memoized in ``memo``."""
+    key = (id(statement1), memo.context(statement1.method), id(statement2), memo.context(statement2.method))
+    if key in memo.pairs:
+        memo.pair_hits += 1
+        return memo.pairs[key]
+    memo.pair_misses += 1
 
-def process_leaf(leaf1, leaf2):
-    leaf1_ast = leaf1.get_ast_node()
-    leaf2_ast = leaf2.get_ast_node()
-    abstract_node = ["Return", "Raise", "Assert"]
-
-    if leaf1.ast_type() in abstract_node:
-        leaf1_children = list(ast.iter_child_nodes(leaf1_ast))
-        if len(leaf1_children) == 0:
-            leaf1_ast = ast.Expr(ast.Constant("", kind=""))
-        else:
-            leaf1_ast = ast.Expr(list(ast.iter_child_nodes(leaf1_ast))[0])
-        if leaf2.ast_type() not in abstract_node and 'value' in leaf2_ast.__dict__.keys():
-            leaf2_ast = ast.Expr(leaf2_ast.value)
-
-    if leaf2.ast_type() in abstract_node:
-        leaf2_children = list(ast.iter_child_nodes(leaf2_ast))
-        if len(leaf2_children) == 0:
-            leaf2_ast = ast.Expr(ast.Constant("", kind=""))
-        else:
-            leaf2_ast = ast.Expr(list(ast.iter_child_nodes(leaf2_ast))[0])
-        if leaf1.ast_type() not in abstract_node and 'value' in leaf1_ast.__dict__.keys():
-            leaf1_ast = ast.Expr(leaf1_ast.value)
+    result = False, None
+    if type(statement1).__name__ == "Statement" and type(statement2).__name__ == "Statement":
+        result = _process_pair(statement1, statement2, memo)
 
-    # print("processed leaf1 from: ", str(old_str_leaf1), " to ", str(leaf1).replace('\n', ''))
-    # print("processed leaf2 from: ", str(old_str_leaf2), " to ", str(leaf2).replace('\n', ''))
+    elif type(statement1).__name__ == "CompositeStatement" and type(
+            statement2).__name__ == "CompositeStatement":
+        if inner_statements_match(statement1.get_all_stmts(), statement2.get_all_stmts(), memo):
+            result = _process_pair(statement1, statement2, memo)
+    memo.pairs[key] = result
+    return result
 
-    leaf1.set_processed_ast_node(leaf1_ast)
-    leaf2.set_processed_ast_node(leaf2_ast)
 
-    leaf1_elements = leaf1.get_elements()
-    leaf2_elements = leaf2.get_elements()
+def _process_pair(leaf1, leaf2, memo):
+    source1, type1, element_kinds1 = _normalized_form(leaf1, leaf2, memo)
+    source2, type2, element_kinds2 = _normalized_form(leaf2, leaf1, memo)
+
+    # condition1 and condition2 hold exactly when both normalized statements are equal, without any replacement
+    if source1 == source2:
+        return True, None
+
+    memo.pruning_pairs += 1
+    if type1 != type2:
+        memo.pruned_by_type += 1
+        return False, None
+    if len(element_kinds1 & element_kinds2) == 0:
+        memo.pruned_by_elements += 1
+        return False, None
+    return process_leaf(leaf1, leaf2)
 
-    argsToParams1 = leaf1.method.argsToParams
-    argsToParams2 = leaf2.method.argsToParams
 
-    if not len(argsToParams1) == 0:
-        argumentization(leaf1_ast, leaf1_elements, argsToParams1)
-    if not len(argsToParams2) == 0:
-        argumentization(leaf2_ast, leaf2_elements, argsToParams2)
+def _normalized_form(leaf, other_leaf, memo):
+    """The processed statement of ``leaf`` as process_leaf builds it against ``other_leaf``, memoized in ``memo``.
 
-    leaf1.set_processed_ast_node(leaf1_ast)
-    leaf2.set_processed_ast_node(leaf2_ast)
+    It only depends on the leaf, its method's argsToParams and whether the other leaf is abstract, and is given as
+    its string, its AST type and the histogram of its elements' kinds.
+    """
+    other_abstract = other_leaf.ast_type() in _ABSTRACT_NODES
+    key = (id(leaf), memo.context(leaf.method), other_abstract)
+    if key not in memo.forms:
+        normalize_leaf(leaf, other_abstract)
+        element_kinds = Counter(_element_kind(element) for element in leaf.get_elements())
+        memo.forms[key] = (leaf.get_processed_ast_node_str(), type(leaf.processed_ast_node).__name__, element_kinds)
+    return memo.forms[key]
+
+
+def _element_kind(element):
+    # is_replaceable only pairs elements of the same kind
+    if type(element.name).__name__ in ("Name", "Call", "Attribute"):
+        return "reference"
+    if type(element.name).__base__.__name__ == "operator":
+        return "operator"
+    return type(element.name).__name__
+
+
+def _statement_match(statement1, statement2, _type, reps):
+    return StatementMatch(str(statement1), statement1.index, statement1.ast_node.lineno, str(statement2),
+                          statement2.index, _type, editdistance.eval(str(statement1), str(statement2)),
+                          abs(statement1.depth - statement2.depth), abs(statement1.index - statement2.index), reps)
+
+
+def process_leaf(leaf1, leaf2):
+    normalize_leaf(leaf1, leaf2.ast_type() in _ABSTRACT_NODES)
+    normalize_leaf(leaf2, leaf1.ast_type() in _ABSTRACT_NODES)
 
     c1, c2, c3 = False, False, False
 
@@ -162,6 +196,33 @@ def process_leaf(leaf1, leaf2):
     return c1 or c2 or c3, replacements
 
 
+def normalize_leaf(leaf, other_abstract):
+    """Sets the processed node of a leaf matched against another one, abstract (return, raise, assert) or not.
+
+    An abstract statement is reduced to its expression, as is a statement with a value matched against an abstract
+    one; the arguments of its method's argsToParams are then replaced by their parameters.
+    """
+    leaf_ast = leaf.get_ast_node()
+
+    if leaf.ast_type() in _ABSTRACT_NODES:
+        leaf_children = list(ast.iter_child_nodes(leaf_ast))
+        if len(leaf_children) == 0:
+            leaf_ast = ast.Expr(ast.Constant("", kind=""))
+        else:
+            leaf_ast = ast.Expr(leaf_children[0])
+    elif other_abstract and 'value' in leaf_ast.__dict__.keys():
+        leaf_ast = ast.Expr(leaf_ast.value)
+
+    leaf.set_processed_ast_node(leaf_ast)
+
+    leaf_elements = leaf.get_elements()
+    argsToParams = leaf.method.argsToParams
+    if not len(argsToParams) == 0:
+        argumentization(leaf_ast, leaf_elements, argsToParams)
+
+    leaf.set_processed_ast_node(leaf_ast)
+
+
 def argumentization(leaf_ast, leaf_elements, argsToParams):
     invocations = []
 
@@ -192,14 +253,8 @@ def argumentization(leaf_ast, leaf_elements, argsToParams):
 
 def get_args_to_params(adjacent_m, added_m):
     if adjacent_m.calls(added_m):
-        invocations = []
-        for statement in adjacent_m.get_all_stmts():
-            for element in ast.walk(statement.get_ast_node()):
-                if type(element).__name__ == "Call":
-                    if added_m.name == astunparse.unparse(element.func)[0:-1].split(".")[-1]:
-                        invocations.append(element)
-
-        args = invocations[0].args  # TODO: check others invocs
+        invocation = adjacent_m.call_sites()[added_m.name][0]  # TODO: check others invocs
+        args = [copy_ast(arg) for arg in invocation.args]  # copied, as they are put in processed statements
 
         params = added_m.params
 
@@ -218,13 +273,13 @@ def get_args_to_params(adjacent_m, added_m):
 
 
 def condition1(leaf1, leaf2):
-    if leaf1.get_distance(leaf2) == 0 and leaf1.depth == leaf2.depth:
+    if leaf1.get_distance(leaf2, 0) == 0 and leaf1.depth == leaf2.depth:
         return True
     return False
 
 
 def condition2(leaf1, leaf2):
-    if leaf1.get_distance(leaf2) == 0:
+    if leaf1.get_distance(leaf2, 0) == 0:
         return True
     return False
 
@@ -238,16 +293,17 @@ def condition3(leaf1, leaf2):
     replacements = match_elements(leaf1_elements, leaf2_elements, leaf1,
                                   leaf2)
 
-    if len(replacements.index) == 0:
+    if len(replacements) == 0:
         return False, None
 
-    replacements.sort_values(by=['distance'], inplace=True, ascending=True)
+    replacements = sorted(replacements, key=lambda replacement: replacement["distance"])
 
-    distance = leaf1.replace_and_distance(leaf2, df_replacements=replacements)
+    distance = leaf1.replace_and_distance(leaf2, replacements=replacements, bound=0)
 
     # print(leaf1, leaf2)
     #
-    # replacements.apply(lambda row: display(row), axis=1)
+    # for replacement in replacements:
+    #     display(replacement)
 
     return distance == 0, replacements
 
@@ -267,7 +323,7 @@ def compare(element1, element2):
         if type(element1.name.ctx).__name__ == type(element2.name.ctx).__name__:
             return element1.name.id == element2.name.id
     elif type1 == "Call" and type2 == "Call":
-        return astunparse.unparse(element1.name) == astunparse.unparse(element2.name)
+        return node_to_str(element1) == node_to_str(element2)
     elif type1 == "Attribute" and type2 == "Attribute":
         return element1.name.attr == element2.name.attr
     elif type(element1.name).__base__.__name__ == "operator" and type(
@@ -279,9 +335,14 @@ def compare(element1, element2):
 def get_common_element(elements1, elements2):
     common_elements = []
 
+    # only elements at the same position of their statements can be common
+    elements2_by_index = {}
+    for element2 in elements2:
+        elements2_by_index.setdefault(get_node_index(element2), []).append(element2)
+
     for element1 in elements1:
-        for element2 in elements2:
-            if compare(element1, element2) and get_node_index(element1) == get_node_index(element2):
+        for element2 in elements2_by_index.get(get_node_index(element1), []):
+            if compare(element1, element2):
                 common_elements.append((element1, element2))
 
     for common_element in common_elements:
@@ -330,7 +391,7 @@ def match_elements(elements1, elements2, leaf1, leaf2):
         nr.iter = nr.iter + 1
         for element2 in elements2:
             if is_replaceable(element1, element2):
-                replace_distance = nr.replace(element1, element2, leaf1, leaf2)
+                replace_distance = nr.replace(element1, element2, leaf1, leaf2, originalDistance)
                 # replace_distance = leaf1.replace_and_distance(leaf2, element1, element2)
                 if replace_distance <= originalDistance:
                     if type(element1.name).__name__ == "Call" and type(element2.name).__name__ == "Call":
@@ -352,27 +413,30 @@ def match_elements(elements1, elements2, leaf1, leaf2):
         if len(distances) > 0:
             break
 
-    replacements = pd.DataFrame.from_dict(replacements, "index")
-    if len(replacements.index) > 0:
-        for element1 in elements1:
-            min_dist = replacements[replacements.node1 == element1].distance.min()
-            replacements = replacements.drop(replacements[(replacements.distance > min_dist)
-                                                          & (replacements.node1 == element1)].index)
-        for element2 in elements2:
-            min_dist = replacements[replacements.node2 == element2].distance.min()
-            replacements = replacements.drop(replacements[(replacements.distance > min_dist)
-                                                          & (replacements.node2 == element2)].index)
-    return replacements
+    # the closest replacements of each element of the first statement, then the closest of these for each element
+    # of the second one, in the order they were found
+    replacements = _closest_replacements(list(replacements.values()), "node1")
+    return _closest_replacements(replacements, "node2")
+
+
+def _closest_replacements(replacements, node_key):
+    min_distances = {}
+    for replacement in replacements:
+        element_id = id(replacement[node_key])
+        if element_id not in min_distances or replacement["distance"] < min_distances[element_id]:
+            min_distances[element_id] = replacement["distance"]
+    return [replacement for replacement in replacements
+            if replacement["distance"] <= min_distances[id(replacement[node_key])]]
 
 
 def compatible_invocs_subexpression(invoc1, invoc2):
     if is_invoc_cover_stmt(invoc1) and is_invoc_cover_stmt(invoc2):  # strict checking on invoc cover stmt
-        if not (astunparse.unparse(invoc1.name).split(".")[-1].split("(")[0] ==
-                astunparse.unparse(invoc2.name).split(".")[-1].split("(")[0] or
+        if not (node_to_str(invoc1).split(".")[-1].split("(")[0] ==
+                node_to_str(invoc2).split(".")[-1].split("(")[0] or
                 invoc1.name.args == invoc2.name.args):
             return False
-    subexp1 = astunparse.unparse(invoc1.name).split(".")[0:-1]
-    subexp2 = astunparse.unparse(invoc2.name).split(".")[0:-1]
+    subexp1 = node_to_str(invoc1).split(".")[0:-1]
+    subexp2 = node_to_str(invoc2).split(".")[0:-1]
     intersection = [value for value in subexp1 if value in subexp2]
     difference1 = list(set(subexp1).difference(set(intersection)))
     difference2 = list(set(subexp2).difference(set(intersection)))
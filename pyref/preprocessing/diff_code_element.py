@@ -1,5 +1,6 @@
 from dataclasses import dataclass
 
+from pyref.preprocessing.conditions_match import MatchMemo
 from pyref.preprocessing.refactoring_heuristics import extract_method_ref, method_signature_change_ref, inline_method_ref, \
     move_method_ref, change_class_signature
 
@@ -11,13 +12,16 @@ class DiffRev:
     removed_modules: list
     diff_common_modules: list
 
-    def get_refactorings(self):
+    def get_refactorings(self, memo=None):
+        """The refactorings of the revision difference; statement mappings are shared through ``memo``, a
+        MatchMemo created for the call unless one is given, e.g. to read its hit and miss counts."""
+        memo = MatchMemo() if memo is None else memo
         refactorings = []
 
         for diff_module in self.diff_common_modules:
-            refactorings = refactorings + diff_module.get_refactorings()  # append
+            refactorings = refactorings + diff_module.get_refactorings(memo)  # append
 
-        refactorings = refactorings + move_method_ref(self.diff_common_modules)
+        refactorings = refactorings + move_method_ref(self.diff_common_modules, memo)
         return refactorings
 
 
@@ -31,19 +35,18 @@ class DiffModule:
     added_methods: list
     removed_methods: list
 
-    def get_refactorings(self):
+    def get_refactorings(self, memo=None):
         refactorings = []
 
         for diff_class in self.diff_common_classes:
-            refactorings = refactorings + diff_class.get_refactorings()
+            refactorings = refactorings + diff_class.get_refactorings(memo)
 
         refactorings = refactorings + \
                        method_signature_change_ref(self.added_methods, self.removed_methods,
-                                                   self.common_methods) + change_class_signature(self.removed_classes,
-                                                                                                 self.added_classes,
-                                                                                                 self.common_classes) + \
-                       extract_method_ref(self.common_methods, self.added_methods) + inline_method_ref(
-            self.common_methods, self.removed_methods)
+                                                   self.common_methods, memo) + change_class_signature(
+            self.removed_classes, self.added_classes, self.common_classes) + \
+                       extract_method_ref(self.common_methods, self.added_methods, memo) + inline_method_ref(
+            self.common_methods, self.removed_methods, memo)
 
         return refactorings
 
@@ -54,10 +57,10 @@ class DiffClass:
     added_methods: list
     removed_methods: list
 
-    def get_refactorings(self):
+    def get_refactorings(self, memo=None):
         refactorings = []
         refactorings = refactorings + method_signature_change_ref(self.added_methods, self.removed_methods,
-                                                                  self.common_methods) + \
-                       extract_method_ref(self.common_methods, self.added_methods) + inline_method_ref(
-            self.common_methods, self.removed_methods)
+                                                                  self.common_methods, memo) + \
+                       extract_method_ref(self.common_methods, self.added_methods, memo) + inline_method_ref(
+            self.common_methods, self.removed_methods, memo)
         return refactorings
@@ -1,3 +1,4 @@
+import ast
 import json
 import logging
 import os
@@ -8,13 +9,11 @@ import threading
 
 from os import path
 
-import pandas as pd
-from ast import *
-
-import pandas.errors
-
-from pyref.preprocessing.revision import Rev
-from pyref.preprocessing.utils import to_tree
+from pyref.preprocessing.ast_cache import AstCache
+from pyref.preprocessing.conditions_match import MatchMemo
+from pyref.preprocessing.revision import Rev, unchanged_methods
+from pyref.repomanager.change_store import CHANGES_FILE_EXTENSION, commit_changes_path, read_commit_changes
+from pyref.repomanager.manifest import Manifest, file_signature, recorded_commits
 
 
 class RepeatedTimer(object):
@@ -48,18 +47,36 @@ def timeout_handler(num, stack):
     raise TimeoutError
 
 
-def _get_refactorings_from_commit_diffs_file(commit_file_path, directory=None, skip_time=None):
-    try:
-        df = pd.read_csv(commit_file_path)
-    except pandas.errors.EmptyDataError:
+def _get_refactorings_from_commit_diffs_file(commit_file_path, directory=None, skip_time=None, ast_cache=None,
+                                             skip_unchanged_methods=False):
+    changed_files = read_commit_changes(commit_file_path)
+    return get_refactorings_from_changed_files(changed_files, commit_file_path, directory, skip_time, ast_cache,
+                                               skip_unchanged_methods)
+
+
+def _in_directory(path, directory):
+    # ``directory`` is a path or a list of paths, each a file or a directory whose files are all kept
+    entries = [directory] if isinstance(directory, str) else directory
+    return any(path == entry or path.startswith(entry.rstrip('/') + '/') for entry in entries)
+
+
+def get_refactorings_from_changed_files(changed_files, commit_label, directory=None, skip_time=None, ast_cache=None,
+                                        skip_unchanged_methods=False):
+    """Detects the refactorings between the old and current versions of ``changed_files``.
+
+    With ``skip_unchanged_methods`` set, methods whose source lines are the same in both versions of a file are
+    extracted without their statements.
+    """
+    if len(changed_files) == 0:
         return list()
 
     if directory is not None:
-        df = df[df["Path"].isin(directory)]
+        changed_files = [changed_file for changed_file in changed_files if _in_directory(changed_file.path, directory)]
 
     rev_a = Rev()
     rev_b = Rev()
-    df.apply(lambda row: populate(row, rev_a, rev_b), axis=1)
+    for changed_file in changed_files:
+        populate(changed_file, rev_a, rev_b, ast_cache, skip_unchanged_methods)
 
     if skip_time is not None:
         signal.signal(signal.SIGALRM, timeout_handler)
@@ -67,19 +84,26 @@ def _get_refactorings_from_commit_diffs_file(commit_file_path, directory=None, s
     rt = RepeatedTimer(480)
     try:
         rev_difference = rev_a.revision_difference(rev_b)
-        return list(rev_difference.get_refactorings())
+        memo = MatchMemo()
+        refactorings = list(rev_difference.get_refactorings(memo))
+        logging.debug('Commit %s: %d/%d method mappings and %d/%d statement pairs reused; %d of %d pairs left to '
+                      'replacement matching pruned (%d by statement type, %d by element kinds).', commit_label,
+                      memo.mapping_hits, memo.mapping_hits + memo.mapping_misses, memo.pair_hits,
+                      memo.pair_hits + memo.pair_misses, memo.pruned_by_type + memo.pruned_by_elements,
+                      memo.pruning_pairs, memo.pruned_by_type, memo.pruned_by_elements)
+        return refactorings
 
     except Exception as e:
-        logging.warning(f'Failed to process commit file {commit_file_path}.', e)
+        logging.warning(f'Failed to process commit file {commit_label}.', e)
     except TimeoutError as e:
-        logging.warning(f'Commit file {commit_file_path} skipped due to the long processing time.')
+        logging.warning(f'Commit file {commit_label} skipped due to the long processing time.')
     finally:
         rt.stop()
         if skip_time is not None:
             signal.alarm(0)
 
 
-def _output_refactorings_to_json(commit_id_str, refactorings, project_refactorings_dir):
+def output_refactorings_to_json(commit_id_str, refactorings, project_refactorings_dir):
     logging.debug('Exporting commit=[%3s]; with [%n] refactorings.', commit_id_str, len(refactorings))
     json_root_object = {
         'commit': commit_id_str,
@@ -95,37 +119,91 @@ def extract_refactorings_for_commit(
         changes_path,
         directory=None,
         skip_time=None,
-        project_refactorings_dir_name=None):
+        project_refactorings_dir_name=None,
+        ast_cache=None,
+        skip_unchanged_methods=False):
 
-    commit_diffs_path = f'{changes_path}{os.sep}{commit_id_str}.csv'
-    refactorings = _get_refactorings_from_commit_diffs_file(commit_diffs_path, directory, skip_time)
+    commit_diffs_path = commit_changes_path(changes_path, commit_id_str)
+    refactorings = _get_refactorings_from_commit_diffs_file(commit_diffs_path, directory, skip_time, ast_cache,
+                                                            skip_unchanged_methods)
 
     if project_refactorings_dir_name is not None:
-        _output_refactorings_to_json(commit_id_str, refactorings, project_refactorings_dir_name)
+        output_refactorings_to_json(commit_id_str, refactorings, project_refactorings_dir_name)
 
     return refactorings
 
 
-def build_diff_lists(changes_path, directory=None, skip_time=None, project_refactorings_dir=None):
+def build_diff_lists(changes_path, directory=None, skip_time=None, project_refactorings_dir=None, resume=False,
+                     ast_cache=None, skip_unchanged_methods=False):
+    """Detects the refactorings of every commit mined into ``changes_path``.
+
+    Processed commits are recorded in the manifest of ``project_refactorings_dir`` together with the signature of
+    their change file. With ``resume`` set, commits whose refactorings file exists and whose change file is unchanged
+    since are skipped and left out of the result. Commits are processed in the order the manifest of ``changes_path``
+    records them, so that the AST cache reuses the trees consecutive commits share. Change files in the former CSV
+    format are not read: a warning reports how many were found.
+    """
 
     pathlib.Path(project_refactorings_dir).mkdir(parents=True, exist_ok=True)
 
+    manifest = Manifest(project_refactorings_dir, {'directory': directory, 'skip_time': skip_time,
+                                                   'skip_unchanged_methods': skip_unchanged_methods})
+    _ast_cache = AstCache() if ast_cache is None else ast_cache
+
     refactorings = list()
+    csv_files_count = 0
 
+    commit_files = list()
     for root, dirs, files in os.walk(changes_path):
         for _, commit_file_name in enumerate(files):
-            if commit_file_name.endswith(".csv"):
-                commit_id_str = commit_file_name.split(".")[0]
-                commit_refactorings = extract_refactorings_for_commit(
-                    commit_id_str, changes_path, directory, skip_time, project_refactorings_dir)
-                refactorings.append((commit_id_str, commit_refactorings))
+            if commit_file_name.endswith('.csv'):
+                csv_files_count += 1
+            if commit_file_name.endswith(CHANGES_FILE_EXTENSION):
+                commit_files.append((root, commit_file_name[:-len(CHANGES_FILE_EXTENSION)]))
+
+    # in the order the commits were mined, which follows the history: a file's version in one commit is usually its
+    # version in the next one too, and its tree is then still in the cache
+    commit_order = {commit_id: index for index, commit_id in enumerate(recorded_commits(changes_path))}
+    commit_files.sort(key=lambda commit_file: commit_order.get(commit_file[1], len(commit_order)))
+
+    for root, commit_id_str in commit_files:
+        source = file_signature(f'{root}{os.sep}{commit_id_str}{CHANGES_FILE_EXTENSION}')
+        if resume and manifest.is_done(commit_id_str, f'{project_refactorings_dir}{os.sep}{commit_id_str}', source):
+            continue
+        commit_refactorings = extract_refactorings_for_commit(
+            commit_id_str, changes_path, directory, skip_time, project_refactorings_dir, _ast_cache,
+            skip_unchanged_methods)
+        manifest.mark_done(commit_id_str, source)
+        refactorings.append((commit_id_str, commit_refactorings))
+
+    if csv_files_count > 0:
+        logging.warning(f'Ignored {csv_files_count} change files of {changes_path} in the former CSV format; mine '
+                        f'their commits again to detect their refactorings.')
 
     return refactorings
 
 
-def populate(row, rev_a, rev_b):
-    path = row["path"]
-    rav_a_tree = to_tree(eval(row["oldFileContent"]))
-    rev_b_tree = to_tree(eval(row["currentFileContent"]))
-    rev_a.extract_code_elements(rav_a_tree, path)
-    rev_b.extract_code_elements(rev_b_tree, path)
+def build_diff_lists_args(args):
+    changes_path = f'{args.repopath}{os.sep}changes'
+    project_refactorings_dir = args.output if args.output else f'{args.repopath}{os.sep}refactorings'
+    build_diff_lists(changes_path, args.directory, args.skip, project_refactorings_dir, args.resume)
+
+
+def _parse_source(blob_sha, source, ast_cache):
+    if ast_cache is None:
+        return ast.parse(source)
+    return ast_cache.get(blob_sha, lambda: ast.parse(source))
+
+
+def populate(changed_file, rev_a, rev_b, ast_cache=None, skip_unchanged_methods=False):
+    path = changed_file.path
+    try:
+        rav_a_tree = _parse_source(changed_file.old_blob_sha, changed_file.old_source, ast_cache)
+        rev_b_tree = _parse_source(changed_file.current_blob_sha, changed_file.current_source, ast_cache)
+    except Exception as _:
+        logging.debug(f'Skipping {path}: one of its versions does not parse.')
+        return
+    unchanged = unchanged_methods(rav_a_tree, changed_file.old_source, rev_b_tree, changed_file.current_source) \
+        if skip_unchanged_methods else None
+    rev_a.extract_code_elements(rav_a_tree, path, unchanged)
+    rev_b.extract_code_elements(rev_b_tree, path, unchanged)
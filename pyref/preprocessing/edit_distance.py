@@ -0,0 +1,34 @@
+import editdistance
+
+
+def edit_distance(str1, str2, bound=None):
+    """Levenshtein distance of two strings, as ``editdistance.eval`` computes it.
+
+    With a ``bound``, only distances up to the bound are exact; a larger distance is reported as ``bound + 1``. Equal
+    strings, and strings whose lengths differ by more than the bound, are then settled without computing the distance,
+    which is otherwise only computed between the parts left once their common prefix and suffix are dropped.
+    """
+    if str1 == str2:
+        return 0
+    if bound is None:
+        return editdistance.eval(str1, str2)
+    if abs(len(str1) - len(str2)) > bound:
+        return bound + 1
+
+    prefix = _common_prefix_length(str1, str2)
+    str1, str2 = str1[prefix:], str2[prefix:]
+    suffix = _common_prefix_length(str1[::-1], str2[::-1])
+    distance = editdistance.eval(str1[:len(str1) - suffix], str2[:len(str2) - suffix])
+    return distance if distance <= bound else bound + 1
+
+
+def _common_prefix_length(str1, str2):
+    # binary search over slice comparisons, which run in C
+    low, high = 0, min(len(str1), len(str2))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if str1[:middle] == str2[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
@@ -0,0 +1,113 @@
+import ast
+from bisect import bisect_left
+
+
+class TreeNode:
+    """A node of an IndexedTree.
+
+    ``name`` is the wrapped AST node; ``parent``, ``children``, ``depth``, ``height``, ``path``, ``root`` and
+    ``descendants`` behave like their anytree counterparts, but are read from the tree's arrays.
+    """
+    __slots__ = ('tree', 'index', 'name')
+
+    def __init__(self, tree, index, name):
+        self.tree = tree
+        self.index = index
+        self.name = name
+
+    def __repr__(self):
+        return f'TreeNode({self.name!r})'
+
+    @property
+    def parent(self):
+        parent_index = self.tree.parents[self.index]
+        return None if parent_index < 0 else self.tree.nodes[parent_index]
+
+    @property
+    def children(self):
+        nodes = self.tree.nodes
+        return tuple(nodes[child_index] for child_index in self.tree.children[self.index])
+
+    @property
+    def depth(self):
+        return self.tree.depths[self.index]
+
+    @property
+    def height(self):
+        return self.tree.heights[self.index]
+
+    @property
+    def root(self):
+        return self.tree.nodes[0]
+
+    @property
+    def descendants(self):
+        return tuple(self.tree.nodes[self.index + 1:self.tree.ends[self.index]])
+
+    @property
+    def path(self):
+        path = []
+        node_index = self.index
+        while node_index >= 0:
+            path.append(self.tree.nodes[node_index])
+            node_index = self.tree.parents[node_index]
+        return tuple(reversed(path))
+
+    def find_all(self, type_name=None, base_name=None):
+        """Nodes of this subtree, itself included, whose AST type (or AST base type) has the given name, in preorder."""
+        if type_name is not None:
+            indices = self.tree.types.get(type_name, ())
+        else:
+            indices = self.tree.base_types.get(base_name, ())
+        nodes = self.tree.nodes
+        start = bisect_left(indices, self.index)
+        end = bisect_left(indices, self.tree.ends[self.index], start)
+        return [nodes[node_index] for node_index in indices[start:end]]
+
+
+class IndexedTree:
+    """An AST flattened once in preorder.
+
+    Node ``i`` is the ``i``-th node of a preorder walk; parent index, depth, height and the end of its subtree (so
+    that its descendants are the nodes ``i + 1`` to ``ends[i] - 1``) are kept in flat lists. Node indices are also
+    bucketed by AST type name and base type name, which turns type searches into two binary searches.
+    """
+
+    def __init__(self, ast_node):
+        self.nodes = []
+        self.parents = []
+        self.children = []
+        self.depths = []
+        self.types = {}
+        self.base_types = {}
+        self.statement_elements = {}  # get_statement_elements results, by node index
+        self.sources = {}  # node_to_str results, by node index
+
+        stack = [(ast_node, -1, 0)]
+        while len(stack) > 0:
+            node, parent_index, depth = stack.pop()
+            node_index = len(self.nodes)
+            self.nodes.append(TreeNode(self, node_index, node))
+            self.parents.append(parent_index)
+            self.children.append([])
+            self.depths.append(depth)
+            self.types.setdefault(type(node).__name__, []).append(node_index)
+            self.base_types.setdefault(type(node).__base__.__name__, []).append(node_index)
+            if parent_index >= 0:
+                self.children[parent_index].append(node_index)
+            for child in reversed(list(ast.iter_child_nodes(node))):
+                stack.append((child, node_index, depth + 1))
+
+        self.heights = [0] * len(self.nodes)
+        self.ends = [0] * len(self.nodes)
+        for node_index in range(len(self.nodes) - 1, -1, -1):
+            child_indices = self.children[node_index]
+            if len(child_indices) > 0:
+                self.heights[node_index] = max(self.heights[child_index] for child_index in child_indices) + 1
+                self.ends[node_index] = self.ends[child_indices[-1]]
+            else:
+                self.ends[node_index] = node_index + 1
+
+    @property
+    def root(self):
+        return self.nodes[0]
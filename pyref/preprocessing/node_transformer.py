@@ -1,39 +1,38 @@
 import ast
+import copy
 import re
 from ast import *
 import astunparse
-import editdistance
+
+from pyref.preprocessing.edit_distance import edit_distance
 
 
 class replaceProt:
+    """Scores replacements of elements of one statement by elements of another, as match_elements tries them.
+
+    Statements and elements are dumped, and their occurrences in the first statement's dump found, once per instance;
+    each replacement then only splices the dump of the new element at the position of the replaced one.
+    """
+
     def __init__(self):
         self.prev_nodes = []
         self.iter = 0
         self.prevIter = 1
+        self._leaf_texts = {}  # (id(leaf1), id(leaf2)) -> (leaf1, leaf2, escaped dump of leaf1, repr of that of leaf2)
+        self._node_texts = {}  # id(node) -> (node, escaped dump)
+        self._occurrences = {}  # (escaped dump of a node, of a statement) -> matches of the first in the second
 
-    def replace(self, node1, node2, leaf1, leaf2=None):
-        leaf1_text = ast.dump(leaf1.get_processed_ast_node()).replace('\\', '\\\\')
-        leaf2_text = ast.dump(leaf2.get_processed_ast_node()).replace('\\', '\\\\')
+    def replace(self, node1, node2, leaf1, leaf2=None, bound=None):
+        """Edit distance of the dumps of leaf1, with the next occurrence of node1 replaced by node2, and of leaf2.
 
-        if type(leaf1).__name__ == "CompositeStatement" and type(leaf2).__name__ == "CompositeStatement":
-            procleaf1 = leaf1.get_processed_ast_node()
-            procleaf2 = leaf2.get_processed_ast_node()
-            procleaf1.body = []
-            procleaf2.body = []
-            leaf1_text = ast.dump(procleaf1).replace('\\', '\\\\')
-            leaf2_text = ast.dump(procleaf2).replace('\\', '\\\\')
+        With a ``bound``, the distance is only exact up to it.
+        """
+        leaf1_text, leaf2_repr = self._statement_texts(leaf1, leaf2)
 
-        # print(astunparse.unparse(eval(leaf1_text)))
-        # print(astunparse.unparse(eval(leaf2_text)))
+        node1_text = self._node_text(node1.name)
+        node2_text = self._node_text(node2.name)
 
-        node1_text = ast.dump(node1.name).replace('\\', '\\\\')
-        node2_text = ast.dump(node2.name).replace('\\', '\\\\')
-
-        # print("node1:", astunparse.unparse(node1.name))
-        # print("node2:", astunparse.unparse(node2.name))
-
-        matches = re.finditer(r'%s' % re.escape(node1_text), leaf1_text)
-        matches = list(matches)
+        matches = self._matches(node1_text, leaf1_text)
         matches_count = len(matches)
 
         _index = 1
@@ -58,27 +57,63 @@ class replaceProt:
             self.prevIter = self.iter
             # print(_index, matches_count)
             if _index <= matches_count:
-                _from = matches[_index - 1].start()
-                copy_text = leaf1_text[_from:]
-                copy_text = re.sub(r'%s' % re.escape(node1_text), node2_text, copy_text, count=1)
-                copy_text = leaf1_text[:_from] + copy_text
-                distance = editdistance.eval(repr(copy_text), repr(leaf2_text))
+                match = matches[_index - 1]
+                # node2's dump is expanded as a re.sub template, since it was escaped as one
+                copy_text = leaf1_text[:match.start()] + match.expand(node2_text) + leaf1_text[match.end():]
+                distance = edit_distance(repr(copy_text), leaf2_repr, bound)
                 # print("Distance", distance)
                 return distance
         return
 
+    def _statement_texts(self, leaf1, leaf2):
+        key = (id(leaf1), id(leaf2))
+        if key not in self._leaf_texts:
+            # the processed nodes are only dumped, so they need no copy; composites are dumped through a shallow copy
+            if type(leaf1).__name__ == "CompositeStatement" and type(leaf2).__name__ == "CompositeStatement":
+                procleaf1 = copy.copy(leaf1.processed_ast_node)
+                procleaf2 = copy.copy(leaf2.processed_ast_node)
+                procleaf1.body = []
+                procleaf2.body = []
+                leaf1_text = ast.dump(procleaf1).replace('\\', '\\\\')
+                leaf2_text = ast.dump(procleaf2).replace('\\', '\\\\')
+            else:
+                leaf1_text = ast.dump(leaf1.processed_ast_node).replace('\\', '\\\\')
+                leaf2_text = ast.dump(leaf2.processed_ast_node).replace('\\', '\\\\')
+            self._leaf_texts[key] = (leaf1, leaf2, leaf1_text, repr(leaf2_text))
+        return self._leaf_texts[key][2:]
+
+    def _node_text(self, node):
+        if id(node) not in self._node_texts:
+            self._node_texts[id(node)] = (node, ast.dump(node).replace('\\', '\\\\'))
+        return self._node_texts[id(node)][1]
+
+    def _matches(self, node_text, leaf_text):
+        key = (node_text, leaf_text)
+        if key not in self._occurrences:
+            self._occurrences[key] = list(re.finditer(r'%s' % re.escape(node_text), leaf_text))
+        return self._occurrences[key]
+
 
 class nodeReplace(ast.NodeTransformer):
+    """Replaces ``node1`` by ``node2`` in the visited tree.
+
+    When ``copy_ast`` and ``processed_node`` are given, ``node1`` belongs to ``processed_node`` and the visited tree is
+    ``copy_ast``, a copy of it: the node replaced is the one at the position of ``node1`` in ``ast.walk`` order, if it
+    dumps the same.
+    """
+
     def __init__(self, node1, node2, copy_ast=None, processed_node=None, parent=None):
         self.node1 = node1
         self.node2 = node2
         self.parent = parent
         self.copy_ast = copy_ast
         self.processed_node = processed_node
+        self._node1_dump = None
+        self._node1_index = None
 
     def generic_visit(self, node):
         ast.NodeTransformer.generic_visit(self, node)
-        if self.is_ast_equal(node, self.node1):
+        if self.is_ast_equal(node):
             if self.parent is not None:
                 if type(self.parent.name).__name__ == "JoinedStr":
                     return ast.FormattedValue(value=self.node2, conversion=-1, format_spec=None)
@@ -98,17 +133,26 @@ class nodeReplace(ast.NodeTransformer):
             return self.node2
         return node
 
-    def is_ast_equal(self, node, node1):
+    def is_ast_equal(self, node):
         if self.processed_node is None and self.copy_ast is None:
-            return node == node1
-
-        copy_elements = list(ast.walk(self.copy_ast))
-        proc_elements = list(ast.walk(self.processed_node))
-
-        node_index = copy_elements.index(node)
-        node1_index = proc_elements.index(node1)
-
-        if node_index == node1_index:
-            if ast.dump(copy_elements[node_index]) == ast.dump(proc_elements[node1_index]):
-                return True
-        return False
+            return node == self.node1
+
+        # a node dumping like node1 is necessarily of its type: positions, which walk both trees, are only compared
+        # for the few nodes that pass both checks. node1's dump and position are computed once, on first need.
+        if type(node) is not type(self.node1):
+            return False
+        if self._node1_dump is None:
+            self._node1_dump = ast.dump(self.node1)
+        if ast.dump(node) != self._node1_dump:
+            return False
+        if self._node1_index is None:
+            self._node1_index = _walk_index(self.processed_node, self.node1)
+        return _walk_index(self.copy_ast, node) == self._node1_index
+
+
+def _walk_index(tree, node):
+    """Position of the first occurrence of ``node`` in ``ast.walk(tree)``."""
+    for index, element in enumerate(ast.walk(tree)):
+        if element is node:
+            return index
+    raise ValueError(f'{node!r} is not in the tree')
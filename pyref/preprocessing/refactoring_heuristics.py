@@ -6,39 +6,36 @@ from pyref.preprocessing.refactorings import ExtractInlineRef, RenameRef, MoveRe
 from pyref.preprocessing.utils import intersection
 
 
-def extract_method_ref(common_methods, added_methods):
+def _overmapped_stmts(mapped_stmts, method1, method2, keep):
+    """Mapped statement strings of either method whose mapped count fails ``keep(count, count1, count2)``, given
+    their number of mappings and their number of occurrences in each method."""
+    counts1 = method1.get_stmt_counts()
+    counts2 = method2.get_stmt_counts()
+    mapped_counts = mapped_stmts.stmt1_counts()
+    return [stmt for stmt, count in mapped_counts.items() if (stmt in counts1 or stmt in counts2) and
+            not keep(count, counts1[stmt], counts2[stmt])]
+
+
+def extract_method_ref(common_methods, added_methods, memo=None):
     refs = []
 
     for tuple_m in common_methods:
+        # names called in the current version of the method only
+        extracted_names = tuple_m[1].call_sites().keys() - tuple_m[0].call_sites().keys()
         for added_m in added_methods[:]:
             method1 = tuple_m[0]
             method2 = tuple_m[1]
-            if not method1.calls(added_m) and method1.class_node == added_m.class_node and method2.calls(added_m):
-                mapped_stmts = body_mapper(tuple_m, added_m, RefInfo.EXTRACT)
-                if len(mapped_stmts.index) == 0:
+            if added_m.name in extracted_names and method1.class_node == added_m.class_node:
+                mapped_stmts = body_mapper(tuple_m, added_m, RefInfo.EXTRACT, memo)
+                if len(mapped_stmts) == 0:
                     continue
 
-                method1_stmts = [{"stmt1": str(stmt)} for stmt in method1.get_all_stmts()]
-                method2_stmts = [{"stmt1": str(stmt)} for stmt in method2.get_all_stmts()]
-
-                method1_stmts_df = pd.DataFrame(method1_stmts).groupby("stmt1")["stmt1"].agg('count').reset_index(
-                    name="count")
-                method2_stmts_df = pd.DataFrame(method2_stmts).groupby("stmt1")["stmt1"].agg('count').reset_index(
-                    name="count")
-
-                stmts_merge = method1_stmts_df.merge(method2_stmts_df, how="outer", on="stmt1").fillna(0)
-
-                mapped_stmts_agg = mapped_stmts.groupby("stmt1")["stmt1"].agg('count').reset_index(name="count")
-
-                mapped_stmts_merge = mapped_stmts_agg.merge(stmts_merge, how="outer", on="stmt1").dropna()
+                to_remove = _overmapped_stmts(mapped_stmts, method1, method2,
+                                              lambda count, count1, count2: abs(count - count1) >= count2)
 
-                to_remove = mapped_stmts_merge[~(
-                        abs(mapped_stmts_merge["count"] - mapped_stmts_merge["count_x"]) >= mapped_stmts_merge[
-                    "count_y"])]["stmt1"].tolist()
+                mapped_stmts = mapped_stmts.without_stmt1(to_remove)
 
-                mapped_stmts = mapped_stmts[~(mapped_stmts["stmt1"].isin(to_remove))]
-
-                mapped_stmts_len = len(mapped_stmts[~mapped_stmts.type.str.contains("inner")].index)
+                mapped_stmts_len = len(mapped_stmts)
 
                 method2_unmapped = added_m.get_total_stmts_count() - mapped_stmts_len
                 if mapped_stmts_len >= method2_unmapped:
@@ -100,38 +97,24 @@ def change_class_signature(removed_classes: list, added_classes: list, common_cl
     return refs
 
 
-def inline_method_ref(common_methods, removed_methods):
+def inline_method_ref(common_methods, removed_methods, memo=None):
     refs = []
     for tuple_m in common_methods:
+        # names called in the previous version of the method only
+        inlined_names = tuple_m[0].call_sites().keys() - tuple_m[1].call_sites().keys()
         for removed_m in removed_methods[:]:
             method1 = tuple_m[0]
             adjacent_method = tuple_m[1]
-            if method1.calls(removed_m) and adjacent_method.class_node == removed_m.class_node and \
-                    not adjacent_method.calls(removed_m):
-                mapped_stmts = body_mapper(tuple_m, removed_m, RefInfo.INLINE)
-                if len(mapped_stmts.index) == 0:
+            if removed_m.name in inlined_names and adjacent_method.class_node == removed_m.class_node:
+                mapped_stmts = body_mapper(tuple_m, removed_m, RefInfo.INLINE, memo)
+                if len(mapped_stmts) == 0:
                     continue
 
-                method1_stmts = [{"stmt1": str(stmt)} for stmt in method1.get_all_stmts()]
-                method2_stmts = [{"stmt1": str(stmt)} for stmt in adjacent_method.get_all_stmts()]
-
-                method1_stmts_df = pd.DataFrame(method1_stmts).groupby("stmt1")["stmt1"].agg('count').reset_index(
-                    name="count")
-                method2_stmts_df = pd.DataFrame(method2_stmts).groupby("stmt1")["stmt1"].agg('count').reset_index(
-                    name="count")
-
-                stmts_merge = method1_stmts_df.merge(method2_stmts_df, how="outer", on="stmt1").fillna(0)
-
-                mapped_stmts_agg = mapped_stmts.groupby("stmt1")["stmt1"].agg('count').reset_index(name="count")
-
-                mapped_stmts_merge = mapped_stmts_agg.merge(stmts_merge, how="outer", on="stmt1").dropna()
-
-                to_remove = mapped_stmts_merge[~(
-                        abs(mapped_stmts_merge["count"] + mapped_stmts_merge["count_x"]) <= mapped_stmts_merge[
-                    "count_y"])]["stmt1"].tolist()
+                to_remove = _overmapped_stmts(mapped_stmts, method1, adjacent_method,
+                                              lambda count, count1, count2: abs(count + count1) <= count2)
 
-                mapped_stmts = mapped_stmts[~(mapped_stmts["stmt1"].isin(to_remove))]
-                mapped_stmts_len = len(mapped_stmts[~mapped_stmts.type.str.contains("inner")].index)
+                mapped_stmts = mapped_stmts.without_stmt1(to_remove)
+                mapped_stmts_len = len(mapped_stmts)
                 method1_unmapped = adjacent_method.get_total_stmts_count() - mapped_stmts_len
                 method2_unmapped = removed_m.get_total_stmts_count() - mapped_stmts_len
                 if mapped_stmts_len > method2_unmapped:
@@ -144,7 +127,7 @@ def inline_method_ref(common_methods, removed_methods):
     return refs
 
 
-def move_method_ref(diff_common_element):
+def move_method_ref(diff_common_element, memo=None):
     diff_common_element = diff_common_element[:]
     refs = []
 
@@ -160,15 +143,15 @@ def move_method_ref(diff_common_element):
         metrics = []
         sub_refs = []
         for added_method in added_methods:
-            mapped_stmts = body_mapper(removed_method, added_method, RefInfo.RENAME)
-            if len(mapped_stmts.index) == 0:
+            mapped_stmts = body_mapper(removed_method, added_method, RefInfo.RENAME, memo)
+            if len(mapped_stmts) == 0:
                 continue
-            mapped_stmts_len = len(mapped_stmts[~mapped_stmts.type.str.contains("inner")].index)
+            mapped_stmts_len = len(mapped_stmts)
             method1_unmapped = abs(removed_method.get_total_stmts_count() - mapped_stmts_len)
             method2_unmapped = abs(added_method.get_total_stmts_count() - mapped_stmts_len)
             if mapped_stmts_len >= method1_unmapped and mapped_stmts_len >= method2_unmapped and added_method.name == removed_method.name:
-                priority = len(mapped_stmts[mapped_stmts['replacements'].isnull()])
-                total_distance = mapped_stmts["distance"].sum()
+                priority = mapped_stmts.unreplaced_count()
+                total_distance = mapped_stmts.total_distance()
                 if len(metrics) == 0:
                     metrics = [priority / mapped_stmts_len, total_distance, mapped_stmts_len]
                 else:
@@ -213,22 +196,22 @@ def move_method_ref(diff_common_element):
     return refs
 
 
-def method_signature_change_ref(added_methods, removed_methods, common_methods):
+def method_signature_change_ref(added_methods, removed_methods, common_methods, memo=None):
     refs = []
     matched_methods = pd.DataFrame(
         columns=['from', 'to', 'ref_type', 'priority', 'total_distance', 'path', 'm1', 'm2', 'mapped_stmts', 'param_change'])
     mapped_stmts = []
     for removed_method in removed_methods:
         for added_m in added_methods:
-            mapped_stmts = body_mapper(removed_method, added_m, RefInfo.RENAME)
-            if len(mapped_stmts.index) == 0:
+            mapped_stmts = body_mapper(removed_method, added_m, RefInfo.RENAME, memo)
+            if len(mapped_stmts) == 0:
                 continue
             # mapped_stmts_index = len(mapped_stmts.apply(lambda row: not ("inner" in row["type"]), axis=1))
-            mapped_stmts_len = len(mapped_stmts[~mapped_stmts.type.str.contains("inner")].index)
+            mapped_stmts_len = len(mapped_stmts)
             method1_unmapped = abs(removed_method.get_total_stmts_count() - mapped_stmts_len)
             method2_unmapped = abs(added_m.get_total_stmts_count() - mapped_stmts_len)
             other_added_methods = [added_m for added_m in added_methods if not added_m.name == added_m.name]
-            extracted_refs = extract_method_ref([(removed_method, added_m)], other_added_methods)
+            extracted_refs = extract_method_ref([(removed_method, added_m)], other_added_methods, memo)
             refs.extend(extracted_refs)
             if added_m.class_node == removed_method.class_node and \
                     ((method1_unmapped == 0 and method2_unmapped == 0) or (
@@ -264,8 +247,8 @@ def method_signature_change_ref(added_methods, removed_methods, common_methods):
                 if not added_m.return_type() == removed_method.return_type():
                     _changes.append("Change Return Type")
 
-                priority = len(mapped_stmts[mapped_stmts['replacements'].isnull()])
-                total_distance = mapped_stmts["distance"].sum()
+                priority = mapped_stmts.unreplaced_count()
+                total_distance = mapped_stmts.total_distance()
                 common_methods.append((removed_method, added_m))
                 if len(_changes) > 0:
                     matched_methods = matched_methods.append(
@@ -90,7 +90,7 @@ class ExtractInlineRef(Refactoring):
             "Location": self._location,
             "Original Method Line": "(" + str(self._tuple_methods[0].position) + "," + str(self._tuple_methods[1].position) + ")",
             "Extracted/Inlined Method Line": self._updated_method.position,
-            "Extracted/Inlined Lines": sorted(self._matched_statements.s1Lineno.tolist()),
+            "Extracted/Inlined Lines": sorted(match.s1Lineno for match in self._matched_statements),
             "Description": self.__str__().split("|")[-2],
             # "Matched Statements": list(zip(self._matched_statements.stmt1, self._matched_statements.stmt2))
         }
@@ -1,10 +1,10 @@
 import ast
 
 import astunparse
-from anytree import findall
 from pyref.preprocessing.code_element import Method, Class, Module, Statement, CompositeStatement
 from pyref.preprocessing.diff_code_element import DiffRev
-from pyref.preprocessing.utils import get_statement_elements, get_expression_elements, different_code_element
+from pyref.preprocessing.utils import get_statement_elements, get_expression_elements, different_code_element, \
+    to_tree
 
 
 class Rev:
@@ -13,7 +13,13 @@ class Rev:
         self.methods = []
         self.classes = []
 
-    def extract_code_elements(self, tree, path):
+    def extract_code_elements(self, tree, path, unchanged_methods=None):
+        """Adds the module at ``path`` to the revision.
+
+        Methods whose (class name, method name) key is in ``unchanged_methods`` are added as stubs, without statements.
+        """
+        if isinstance(tree, ast.AST):  # a module tree as parsed, or as shared through an AstCache
+            tree = to_tree(tree)
         if tree is None:
             print("Tree is null...")
         else:
@@ -21,28 +27,15 @@ class Rev:
             module_name = path
             module = Module(module_name)
 
-            classes = findall(tree, filter_=lambda node: type(node.name).__name__ == "ClassDef")
-            methods = findall(tree, filter_=lambda node: type(node.name).__name__ == "FunctionDef")
+            scan = _ModuleScan(tree)
+
+            init_fields = [field.name.attr for field in scan.init_attributes if
+                           'self' in astunparse.unparse(field.name.value)]
 
-            for class_node in classes:
+            rev_classes = {}
+            for class_node in scan.classes:
                 name = class_node.name.name
-                init_methods = [method for method in methods if
-                                method.name.name == "__init__"]  # Search for init methods
-                init_fields = []
-                if len(init_methods) > 0:  # there exists an init method
-                    init_method = init_methods[0]
-                    init_fields = findall(init_method, filter_=lambda node: type(node.name).__name__ == "Attribute")
-                    init_fields = [field.name.attr for field in [field for field in init_fields if
-                                                                 'self' in astunparse.unparse(
-                                                                     field.name.value) and type(
-                                                                     field.name.ctx).__name__ == "Store"]]
-
-                fields = findall(class_node, filter_=lambda node: type(node.name).__name__ == "Name")
-                fields = [field.name.id for field in fields if
-                          type(field.name.ctx).__name__ == "Store" and len([parent for parent in list(field.path) if
-                                                                            type(
-                                                                                parent.name).__name__ == "FunctionDef"]) == 0]
-                fields = fields + init_fields
+                fields = [field.name.id for field in scan.class_names[class_node.index]] + init_fields
 
                 class_bases = [base.id for base in class_node.name.bases if type(base).__name__ == "Name"]
 
@@ -51,23 +44,18 @@ class Rev:
                     class_parent_method = class_node.parent.name.name
 
                 rev_class = Class(name, module, str(class_node.path), fields, class_bases, class_parent_method)
+                rev_classes[class_node.index] = rev_class
 
                 module.add_class(rev_class)
                 self.classes.append(rev_class)
 
             # extract methods
 
-            for method in methods:
+            for method in scan.methods:
                 name = method.name.name
 
-                method_classes = [node for node in method.path if
-                                  type(node.name).__name__ == "ClassDef"]  # last class in case of inner class
-
-                method_class = None
-                if len(method_classes) > 0 and len(self.classes) > 0:
-                    method_class = \
-                        [rev_class for rev_class in self.classes if
-                         rev_class.name == method_classes[-1].name.name and rev_class.class_path == str(method_classes[-1].path) and rev_class.module.name == path][0]
+                method_class_node = scan.enclosing_class(method)  # innermost class in case of inner class
+                method_class = None if method_class_node is None else rev_classes[method_class_node.index]
 
                 params = [arg.arg for arg in method.name.args.args]
 
@@ -76,7 +64,12 @@ class Rev:
                 if method_class is not None:
                     method_class.methods.append(rev_method)
 
-                for index, stmt in enumerate(method.children):
+                if unchanged_methods is not None and \
+                        (None if method_class is None else method_class.name, name) in unchanged_methods:
+                    rev_method.unchanged = True
+
+                statement_nodes = [] if rev_method.unchanged else method.children
+                for index, stmt in enumerate(statement_nodes):
                     if type(stmt.name).__base__.__name__ == "stmt":
                         if type(stmt.name) == ast.Expr and astunparse.unparse(stmt.children[0].name).startswith('\'') or \
                                 "<class 'ast.Ellipsis'>" in astunparse.unparse(stmt.name):
@@ -113,6 +106,89 @@ class Rev:
         return diff_rev
 
 
+class _ModuleScan:
+    """Classes, methods and field candidates of a module tree, collected in a single preorder pass.
+
+    ``class_names`` holds, for each class node index, the stored names of its subtree outside any function, and
+    ``init_attributes`` the stored attributes of the first ``__init__`` of the module, which serves every class.
+    """
+
+    def __init__(self, tree):
+        indexed_tree = tree.tree
+        nodes = indexed_tree.nodes
+        parents = indexed_tree.parents
+
+        self.classes = []
+        self.methods = []
+        self.class_names = {}
+        self.init_attributes = []
+        self._enclosing_classes = [-1] * len(nodes)
+        in_function = [False] * len(nodes)
+        init_end = -1
+
+        for node in nodes[tree.index:indexed_tree.ends[tree.index]]:
+            node_type = type(node.name).__name__
+            parent_index = parents[node.index]
+            if parent_index >= 0:
+                parent_type = type(nodes[parent_index].name).__name__
+                self._enclosing_classes[node.index] = parent_index if parent_type == "ClassDef" else \
+                    self._enclosing_classes[parent_index]
+                in_function[node.index] = in_function[parent_index] or parent_type == "FunctionDef"
+
+            if node_type == "ClassDef":
+                self.classes.append(node)
+                self.class_names[node.index] = []
+            elif node_type == "FunctionDef":
+                self.methods.append(node)
+                if init_end < 0 and node.name.name == "__init__":
+                    init_end = indexed_tree.ends[node.index]
+            elif node_type == "Name" and not in_function[node.index] and type(node.name.ctx).__name__ == "Store":
+                class_index = self._enclosing_classes[node.index]
+                while class_index >= 0:  # a name also belongs to the classes enclosing its class
+                    self.class_names[class_index].append(node)
+                    class_index = self._enclosing_classes[class_index]
+            elif node_type == "Attribute" and node.index < init_end and type(node.name.ctx).__name__ == "Store":
+                self.init_attributes.append(node)
+
+    def enclosing_class(self, node):
+        class_index = self._enclosing_classes[node.index]
+        return None if class_index < 0 else node.tree.nodes[class_index]
+
+
+_BLOCK_FIELDS = ('body', 'orelse', 'handlers', 'finalbody', 'cases')  # the statement lists methods can be found in
+
+
+def _method_sources(tree, source):
+    lines = source.replace('\r\n', '\n').replace('\r', '\n').split('\n')  # numbered as ``ast`` numbers them
+    counts = {}
+    sources = {}
+
+    def visit(node, class_name):
+        for field in _BLOCK_FIELDS:
+            for child in getattr(node, field, ()):
+                if type(child).__name__ == "FunctionDef":
+                    key = (class_name, child.name)
+                    counts[key] = counts.get(key, 0) + 1
+                    first_line = min([child.lineno] + [decorator.lineno for decorator in child.decorator_list])
+                    sources[key] = lines[first_line - 1:child.end_lineno]
+                visit(child, child.name if type(child).__name__ == "ClassDef" else class_name)
+
+    visit(tree, None)
+    return {key: method_source for key, method_source in sources.items() if counts[key] == 1}
+
+
+def unchanged_methods(old_tree, old_source, current_tree, current_source):
+    """Keys of the methods whose source lines, decorators included, are the same in both versions of a module.
+
+    A method is keyed by its innermost class name and its name, which is what ``Method.__eq__`` compares within a
+    module. Keys defined more than once in either version are left out, so that each stub is matched with exactly
+    one identical method. Only the lines each method spans are compared, so no method is dumped or unparsed.
+    """
+    old_sources = _method_sources(old_tree, old_source)
+    current_sources = _method_sources(current_tree, current_source)
+    return {key for key, method_source in old_sources.items() if current_sources.get(key) == method_source}
+
+
 def extract_inner_statements(composite_statement, stmt, method):
     for index, inner_stmt in enumerate(stmt.children):
         if type(
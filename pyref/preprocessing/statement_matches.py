@@ -0,0 +1,54 @@
+from collections import Counter
+from dataclasses import dataclass
+
+
+@dataclass
+class StatementMatch:
+    stmt1: str
+    s1Index: int
+    s1Lineno: int
+    stmt2: str
+    s2Index: int
+    type: str
+    distance: int
+    depth_diff: int
+    index_diff: int
+    replacements: list
+
+    def rank(self):
+        return self.distance, self.depth_diff, self.index_diff
+
+
+class StatementMatches:
+    """Statements matched between two methods by body_mapper, one StatementMatch per pair."""
+
+    def __init__(self, matches=None):
+        self.matches = [] if matches is None else matches
+
+    def __len__(self):
+        return len(self.matches)
+
+    def __iter__(self):
+        return iter(self.matches)
+
+    def best_by(self, key):
+        """The best ranked match of each key, the first one among equally ranked matches, in key order."""
+        best = {}
+        for match in self.matches:
+            match_key = key(match)
+            if match_key not in best or match.rank() < best[match_key].rank():
+                best[match_key] = match
+        return StatementMatches([best[match_key] for match_key in sorted(best)])
+
+    def without_stmt1(self, stmts):
+        stmts = set(stmts)
+        return StatementMatches([match for match in self.matches if match.stmt1 not in stmts])
+
+    def unreplaced_count(self):
+        return len([match for match in self.matches if match.replacements is None])
+
+    def total_distance(self):
+        return sum(match.distance for match in self.matches)
+
+    def stmt1_counts(self):
+        return Counter(match.stmt1 for match in self.matches)
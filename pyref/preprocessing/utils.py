@@ -1,71 +1,100 @@
 import ast
-from anytree import findall, Node
+import copy
+from collections import Counter
+
 import astunparse
-import pandas as pd
 
+from pyref.preprocessing.indexed_tree import IndexedTree
 from pyref.preprocessing.node_transformer import nodeReplace
 
 
-def to_tree(parent_node):
-    if isinstance(parent_node, ast.AST):
-        parent_node = Node(parent_node)
+def to_tree(ast_node):
+    return IndexedTree(ast_node).root
+
+
+# evaluated along with `from ast import *`, a dumped `Constant(value=Ellipsis)` holds the deprecated ast.Ellipsis class
+_EVALUATED_ELLIPSIS = getattr(ast, "Ellipsis", Ellipsis)
 
-    for child in ast.iter_child_nodes(parent_node.name):
-        current_node = Node(child, parent=parent_node)
-        to_tree(current_node)
 
-    return parent_node
+def copy_ast(ast_node):
+    """Deep copy of an AST, as ``eval(ast.dump(ast_node))`` would build it.
+
+    Like the dump, the copy leaves out node attributes (line numbers and offsets), fields the node does not have, and
+    optional fields set to None; every node, including shared context and operator nodes, is a new instance.
+    """
+    if isinstance(ast_node, ast.AST):
+        node_type = type(ast_node)
+        fields = {}
+        for name in ast_node._fields:
+            try:
+                value = getattr(ast_node, name)
+            except AttributeError:
+                continue
+            if value is None and getattr(node_type, name, ...) is None:
+                continue
+            fields[name] = copy_ast(value)
+        return node_type(**fields)
+    if isinstance(ast_node, list):
+        return [copy_ast(value) for value in ast_node]
+    if ast_node is Ellipsis:
+        return _EVALUATED_ELLIPSIS
+    return ast_node
 
 
 def different_code_element(code_elements1, code_elements2):
-    matched = []
-    for element1 in code_elements1:
-        for element2 in code_elements2:
-            if element1 == element2:
-                matched.append((element1, element2))
-
-    removed = code_elements1[:]
-    for element2 in code_elements2:
-        for element1 in removed:
-            if element1 == element2:
-                removed.remove(element1)
-
-    added = code_elements2[:]
-    for element1 in code_elements1:
-        for element2 in added:
-            if element1 == element2:
-                added.remove(element2)
+    keys1 = [element.key() for element in code_elements1]
+    keys2 = [element.key() for element in code_elements2]
+
+    elements2_by_key = {}
+    for key, element2 in zip(keys2, code_elements2):
+        elements2_by_key.setdefault(key, []).append(element2)
+
+    matched = [(element1, element2) for key, element1 in zip(keys1, code_elements1)
+               for element2 in elements2_by_key.get(key, [])]
+    removed = _unmatched_code_elements(code_elements1, keys1, keys2)
+    added = _unmatched_code_elements(code_elements2, keys2, keys1)
 
     return matched, added, removed
 
 
+def _unmatched_code_elements(code_elements, keys, other_keys):
+    # each element of the other side cancels one element with the same key, the earliest first
+    other_counts = Counter(other_keys)
+    unmatched = []
+    for key, element in zip(keys, code_elements):
+        if other_counts[key] > 0:
+            other_counts[key] -= 1
+        else:
+            unmatched.append(element)
+    return unmatched
+
+
 def get_statement_elements(leaf):
-    invocations = list(findall(leaf, filter_=lambda node: type(node.name).__name__ == "Call"))
-    variables = list(findall(leaf, filter_=lambda node: type(node.name).__name__ == "Name"))
+    elements = leaf.tree.statement_elements.get(leaf.index)
+    if elements is None:
+        elements = _statement_elements(leaf)
+        leaf.tree.statement_elements[leaf.index] = elements
+    return list(elements)
+
+
+def _statement_elements(leaf):
+    invocations = leaf.find_all("Call")
+    variables = leaf.find_all("Name")
     for variable in variables[:]:  # Remove function names from vars list
         if type(variable.parent.name).__name__ == "Call":
             for index, child_node in enumerate(variable.parent.children):
                 if variable is child_node and index == 0:
                     variables.remove(variable)
-    constants = list(findall(leaf, filter_=lambda node: type(node.name).__name__ == "Constant"))
-    operators = list(findall(leaf, filter_=lambda node: type(node.name).__base__.__name__ == "operator"))
-    attributes = findall(leaf, filter_=lambda node: type(node.name).__name__ == "Attribute")
+    constants = leaf.find_all("Constant")
+    operators = leaf.find_all(base_name="operator")
+    attributes = leaf.find_all("Attribute")
     attributes = [att for att in attributes if
                   not (type(att.parent.name).__name__ == "Call")]  # REMOVING ATTS THAT ARE NOT VARS
 
     elements = constants + invocations + variables + attributes + operators
 
-    if len(elements) > 0:
-        elements_df = pd.DataFrame(elements, columns=['element_object'])
-
-        elements_df['depth'] = elements_df.apply(lambda x: x['element_object'].depth, axis=1)
-        elements_df['index'] = elements_df.apply(lambda x: x['element_object'].height, axis=1)
-
-        elements_df = elements_df.sort_values(["depth", "index"], ascending=(False, True))
-
-        return elements_df["element_object"].tolist()
-
-    return []
+    # deepest elements first, lowest first among equally deep ones; the sort is stable like the former pandas one
+    return sorted(elements, key=lambda element: (-element.depth, element.height))
 
 
 def get_expression_elements(leaf):
@@ -79,7 +108,7 @@ def get_expression_elements(leaf):
 
 def invoc_cover_stmt(leaf, invoc):
     for count, ast_child in enumerate(ast.iter_child_nodes(leaf.ast_node)):
-        if (count == len(to_tree(leaf.ast_node).children) - 1) and ast_child == invoc.name:
+        if (count == len(leaf.get_tree().children) - 1) and ast_child == invoc.name:
             return True
     return False
 
@@ -93,21 +122,45 @@ def ast_to_str(ast_node):
     return astunparse.unparse(ast_node)[0:-1]
 
 
-def ast_comp_to_str(ast_node):
-    tree = to_tree(ast_node)
+def node_to_str(node):
+    """``astunparse.unparse`` of a tree node's AST, memoized on its tree."""
+    source = node.tree.sources.get(node.index)
+    if source is None:
+        source = astunparse.unparse(node.name)
+        node.tree.sources[node.index] = source
+    return source
+
+
+_BODY_FIELDS = ("body", "orelse", "handlers", "finalbody", "cases")
+
 
-    expression = [child for child in tree.children if type(child.name).__base__.__name__ == "expr"]
+def _header_node(ast_node):
+    header = copy.copy(ast_node)
+    for body_field in _BODY_FIELDS:
+        if hasattr(header, body_field):
+            setattr(header, body_field, [])
+    return header
+
+
+def ast_comp_to_str(ast_node):
+    expression = [child for child in ast.iter_child_nodes(ast_node) if type(child).__base__.__name__ == "expr"]
+    # a compound statement is rendered up to its last expression, which is part of its header: rendering the
+    # statement with empty bodies gives the same prefix without visiting the bodies
+    source = astunparse.unparse(_header_node(ast_node))
 
     if len(expression) > 0:
-        lastNode = [child for child in tree.children if type(child.name).__base__.__name__ == "expr"][-1]
+        lastNode = expression[-1]
 
-        lastNode = astunparse.unparse(lastNode.name)[0:-1]
+        lastNode = astunparse.unparse(lastNode)[0:-1]
 
-        lastNodeIndex = astunparse.unparse(ast_node).index(lastNode) + len(lastNode)
+        if lastNode not in source:  # rendered differently within the header, look for it in the full statement
+            source = astunparse.unparse(ast_node)
 
-        return astunparse.unparse(ast_node)[0:lastNodeIndex]
+        lastNodeIndex = source.index(lastNode) + len(lastNode)
 
-    return astunparse.unparse(ast_node).split(":")[0]  # TRY FINALLY no expression
+        return source[0:lastNodeIndex]
+
+    return source.split(":")[0]  # TRY FINALLY no expression
 
 
 def final_leaf(copy_leaf, leaf, row, processed_ast_elements):
@@ -132,12 +185,16 @@ def get_stmts_recursive(compo_stmt, res=None):
 
 
 def get_node_index(node):
+    """Position of a node among the descendants of its root, in preorder (0 for a module).
+
+    Tree nodes are numbered in preorder when their tree is built, the root first, so this is the node's own index
+    less one.
+    """
     if type(node.name).__name__ == "Module":
         return 0
-    else:
-        node_root = node.root
-        descends = list(node_root.descendants)
-        return descends.index(node)
+    if node.index == 0:
+        raise ValueError(f'{node!r} is the root of its tree, not one of its descendants')
+    return node.index - 1
 
 
 def is_extracted(row, stmts):
@@ -150,6 +207,6 @@ def is_extracted(row, stmts):
             for element in elements:
                 if type(element.name).__name__ == "Name" and type(
                         element.name.ctx).__name__ == "Store" and element.name.id == var.name.id:
-                    if astunparse.unparse(content.name) == astunparse.unparse(stmt.get_ast_node().value):
+                    if astunparse.unparse(content.name) == astunparse.unparse(stmt.ast_node.value):
                         return True
         return False
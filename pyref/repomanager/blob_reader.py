@@ -0,0 +1,26 @@
+class BlobReader:
+    """Reads blob contents by SHA through a single long-lived ``git cat-file --batch`` process.
+
+    GitPython keeps the batch process attached to ``repo.git``, so one reader per worker (and per ``Repo``) avoids
+    spawning a ``git show`` subprocess for every file version.
+    """
+
+    def __init__(self, repo):
+        self.repo = repo
+
+    def read(self, blob_sha):
+        _, _, _, data = self.repo.git.get_object_data(blob_sha)
+        return data.decode('utf-8')
+
+    def read_pair(self, item):
+        """Returns the (old, current) contents of a diff item produced by ``commit.diff(commit.parents[0])``."""
+        return self.read(item.b_blob.hexsha), self.read(item.a_blob.hexsha)
+
+    def close(self):
+        self.repo.git.clear_cache()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
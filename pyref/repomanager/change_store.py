@@ -0,0 +1,47 @@
+import marshal
+import os
+import pathlib
+import zlib
+from dataclasses import dataclass
+
+CHANGES_FILE_EXTENSION = '.changes'
+
+_FORMAT_VERSION = 1
+
+
+@dataclass
+class ChangedFile:
+    path: str
+    old_blob_sha: str
+    old_source: str
+    current_blob_sha: str
+    current_source: str
+
+
+def commit_changes_path(changes_directory, commit_id_str):
+    return f'{changes_directory}{os.sep}{commit_id_str}{CHANGES_FILE_EXTENSION}'
+
+
+def write_commit_changes(file_path, changed_files):
+    """Stores the source text and blob SHA of both sides of every changed file of a commit.
+
+    The records are marshalled and zlib-compressed; reading them back needs neither ``eval`` nor a text parser other
+    than ``ast.parse`` on the sources themselves.
+    """
+    records = [(changed_file.path, changed_file.old_blob_sha, changed_file.old_source, changed_file.current_blob_sha,
+                changed_file.current_source) for changed_file in changed_files]
+    data = zlib.compress(marshal.dumps((_FORMAT_VERSION, records)), 1)
+
+    pathlib.Path(file_path).parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = f'{file_path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'wb') as changes_file:
+        changes_file.write(data)
+    os.replace(temporary_path, file_path)
+
+
+def read_commit_changes(file_path):
+    with open(file_path, 'rb') as changes_file:
+        version, records = marshal.loads(zlib.decompress(changes_file.read()))
+    if version != _FORMAT_VERSION:
+        raise ValueError(f'Unsupported change file version {version} in {file_path}.')
+    return [ChangedFile(*record) for record in records]
@@ -0,0 +1,79 @@
+import json
+import os
+import pathlib
+
+import pyref
+
+MANIFEST_FILE_NAME = 'manifest.jsonl'
+
+
+def _parse_line(line):
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None  # a line cut short by an interrupted run
+
+
+class Manifest:
+    """Append-only record of the commits a mining or detection run has finished.
+
+    The first line holds the tool version and the run settings; each further line records one processed commit. A
+    manifest written by another version or with other settings is discarded, so every commit is processed again.
+    """
+
+    def __init__(self, directory, settings=None):
+        self.path = f'{directory}{os.sep}{MANIFEST_FILE_NAME}'
+        self.header = json.loads(json.dumps({'version': pyref.__version__, 'settings': settings or {}}))
+        self.commits = dict()
+
+        pathlib.Path(directory).mkdir(parents=True, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self.path):
+            with open(self.path) as manifest_file:
+                content = manifest_file.read()
+            lines = content.splitlines()
+            if len(lines) > 0 and _parse_line(lines[0]) == self.header:
+                for line in lines[1:]:
+                    entry = _parse_line(line)
+                    if isinstance(entry, dict) and 'commit' in entry:
+                        self.commits[entry['commit']] = entry.get('source')
+                if not content.endswith('\n'):
+                    with open(self.path, 'a') as manifest_file:
+                        manifest_file.write('\n')
+                return
+
+        with open(self.path, 'w') as manifest_file:
+            manifest_file.write(json.dumps(self.header) + '\n')
+
+    def is_done(self, commit_id, output_path, source=None):
+        """A commit is done if it was recorded from the same source and its output file still exists."""
+        if commit_id not in self.commits or not os.path.exists(output_path):
+            return False
+        return source is None or self.commits[commit_id] == source
+
+    def mark_done(self, commit_id, source=None):
+        entry = {'commit': commit_id}
+        if source is not None:
+            entry['source'] = source
+        with open(self.path, 'a') as manifest_file:
+            manifest_file.write(json.dumps(entry) + '\n')
+        self.commits[commit_id] = source
+
+
+def recorded_commits(directory):
+    """Commits recorded in the manifest of ``directory``, in the order they were processed, without rewriting it."""
+    path = f'{directory}{os.sep}{MANIFEST_FILE_NAME}'
+    if not os.path.exists(path):
+        return list()
+
+    with open(path) as manifest_file:
+        entries = [_parse_line(line) for line in manifest_file.read().splitlines()[1:]]
+    return list(dict.fromkeys(entry['commit'] for entry in entries if isinstance(entry, dict) and 'commit' in entry))
+
+
+def file_signature(file_path):
+    """Size and modification time of a file, used to notice that an input was rewritten since it was processed."""
+    stat = os.stat(file_path)
+    return [stat.st_size, stat.st_mtime_ns]
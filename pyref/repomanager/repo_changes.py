@@ -1,28 +1,59 @@
-import ast
 import os
-import pathlib
+from concurrent.futures import ProcessPoolExecutor
 
-import pandas as pd
-from git import Repo
+from git import BadName, Repo
 
+from pyref.repomanager.blob_reader import BlobReader
+from pyref.repomanager.change_store import ChangedFile, commit_changes_path, write_commit_changes
+from pyref.repomanager.manifest import Manifest
 
-def repository_commits(repo, specific_commits=None):
-    result = list()
+MINING_SETTINGS = {'format': 'change-store', 'change_type': 'M'}
 
-    for commit in repo.iter_commits():
-        if specific_commits is None:
-            result.append(commit)
-        elif str(commit) in specific_commits:
-            result.append(commit)
 
-    return result
+def _resolve_specific_commits(repo, specific_commits):
+    if isinstance(specific_commits, str):
+        specific_commits = specific_commits.replace(',', ' ').split()
+
+    hexshas = list()
+    for specific_commit in specific_commits:
+        try:
+            hexsha = repo.commit(specific_commit).hexsha
+        except (BadName, ValueError):
+            continue  # unknown commits are ignored, as when they were looked up in the history
+        if hexsha not in hexshas:
+            hexshas.append(hexsha)
+    return hexshas
+
+
+def repository_commits(repo, specific_commits=None, rev=None, since=None, until=None, paths=None):
+    """Selects commits through ``git rev-list`` rather than by walking the whole history.
+
+    ``specific_commits`` (SHAs, possibly abbreviated, or anything else ``repo.commit`` resolves) are looked up
+    directly and listed with ``--no-walk``; otherwise the history reachable from ``rev`` (default HEAD, ranges such as
+    ``v1.0..main`` are accepted) is walked. ``since``/``until`` limit commit dates and ``paths`` keeps only the commits
+    touching those paths; both filters are applied by git.
+    """
+    kwargs = dict()
+    if since is not None:
+        kwargs['since'] = since
+    if until is not None:
+        kwargs['until'] = until
+    _paths = paths if paths is not None else ''
+
+    if specific_commits is not None:
+        hexshas = _resolve_specific_commits(repo, specific_commits)
+        if len(hexshas) == 0:
+            return list()
+        return list(repo.iter_commits(hexshas, _paths, no_walk=True, **kwargs))
 
+    return list(repo.iter_commits(rev, _paths, **kwargs))
 
-def _get_item_content_from_commit(commit, item, repo):
-    return ast.dump(ast.parse(repo.git.show(f'{commit.hexsha}:{item.a_path}')), include_attributes=True)
 
+def commit_changed_files(commit, blob_reader):
+    """Reads the old and current source of every modified Python file of ``commit``.
 
-def extract_commit_differences(repo, commit, changes_directory):
+    Sources are kept as text: files that do not parse are skipped when the changes are turned into revisions.
+    """
 
     modified_files = list()
 
@@ -32,35 +63,86 @@ def extract_commit_differences(repo, commit, changes_directory):
             path = item.a_path
             if path.endswith('.py'):
                 try:
-                    old_item_content = _get_item_content_from_commit(commit.parents[0], item, repo)
-                    current_item_content = _get_item_content_from_commit(commit, item, repo)
+                    old_source, current_source = blob_reader.read_pair(item)
                 except Exception as _:
                     continue
 
                 modified_files.append(
-                    {'path': path,
-                     'oldFileContent': old_item_content,
-                     'currentFileContent': current_item_content
-                     })
+                    ChangedFile(path, item.b_blob.hexsha, old_source, item.a_blob.hexsha, current_source))
+
+    return modified_files
+
+
+def extract_commit_differences(repo, commit, changes_directory, blob_reader=None):
+
+    _blob_reader = BlobReader(repo) if blob_reader is None else blob_reader
+
+    modified_files = commit_changed_files(commit, _blob_reader)
+
+    write_commit_changes(commit_changes_path(changes_directory, str(commit)), modified_files)
+    return modified_files
+
 
-    data_frame = pd.DataFrame(modified_files)
-    pathlib.Path(changes_directory).mkdir(parents=True, exist_ok=True)
-    data_frame.to_csv(f'{changes_directory}{os.sep}/{str(commit)}.csv', index=False)
-    return data_frame
+_worker_repo = None
+_worker_blob_reader = None
 
 
-def differences_from_commits(repo, specific_commits=None, changes_directory=None):
+def _init_worker(git_dir):
+    global _worker_repo, _worker_blob_reader
+    _worker_repo = Repo(git_dir)
+    _worker_blob_reader = BlobReader(_worker_repo)
+
+
+def _extract_commit_differences_in_worker(hexsha, changes_directory):
+    commit = _worker_repo.commit(hexsha)
+    return extract_commit_differences(_worker_repo, commit, changes_directory, _worker_blob_reader)
+
+
+def _parallel_commit_differences(repo, commits, changes_directory, workers):
+    hexshas = [commit.hexsha for commit in commits]
+    chunksize = max(1, min(64, len(hexshas) // (workers * 4)))
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(repo.git_dir,)) as executor:
+        # map() yields in submission order, so results stay in commit order whatever the worker scheduling.
+        yield from executor.map(_extract_commit_differences_in_worker, hexshas,
+                                [changes_directory] * len(hexshas), chunksize=chunksize)
+
+
+def _sequential_commit_differences(repo, commits, changes_directory):
+    with BlobReader(repo) as blob_reader:
+        for commit in commits:
+            yield extract_commit_differences(repo, commit, changes_directory, blob_reader)
+
+
+def differences_from_commits(repo, specific_commits=None, changes_directory=None, workers=1, resume=False, rev=None,
+                             since=None, until=None, paths=None):
+    """Mines the modified Python files of every single-parent commit into ``changes_directory``.
+
+    Commits are selected as in ``repository_commits``. Every mined commit is recorded in the manifest of
+    ``changes_directory``. With ``resume`` set, commits that the
+    manifest already records (and whose change file still exists) are skipped and left out of the result.
+    """
 
     _changes_directory = f'{repo.working_dir}{os.sep}changes' if not changes_directory else changes_directory
 
-    result = list()
+    manifest = Manifest(_changes_directory, MINING_SETTINGS)
 
-    commits = repository_commits(repo, specific_commits)
+    commits = [commit for commit in repository_commits(repo, specific_commits, rev, since, until, paths)
+               if len(commit.parents) == 1]
+    if resume:
+        commits = [commit for commit in commits if
+                   not manifest.is_done(commit.hexsha, commit_changes_path(_changes_directory, commit.hexsha))]
+
+    if workers is not None and workers > 1:
+        commits_differences = _parallel_commit_differences(repo, commits, _changes_directory, workers)
+    else:
+        commits_differences = _sequential_commit_differences(repo, commits, _changes_directory)
+
+    result = list()
 
-    for commit in commits:
-        if len(commit.parents) == 1:
-            commit_differences = extract_commit_differences(commit, repo, _changes_directory)
-            result.append((commit, commit_differences))
+    for commit, commit_differences in zip(commits, commits_differences):
+        manifest.mark_done(commit.hexsha)
+        result.append((commit, commit_differences))
 
     return result
 
@@ -72,12 +154,11 @@ def last_commit_changes(repo_path, changes_directory=None):
     _changes_directory = f'{repo.working_dir}{os.sep}changes' if not changes_directory else changes_directory
 
     if len(commit.parents) == 1:
-        commit_differences = extract_commit_differences(repo, commit, changes_directory)
-        commit_differences.to_csv(f'{_changes_directory}{os.sep}/{str(commit)}.csv', index=False)
+        extract_commit_differences(repo, commit, _changes_directory)
 
 
 def repo_changes_args(args):
     if args.lastcommit:
         last_commit_changes(args.path)
     if args.allcommits:
-        differences_from_commits(args.path)
+        differences_from_commits(Repo(args.path), workers=args.workers, resume=args.resume)
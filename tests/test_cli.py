@@ -0,0 +1,62 @@
+import json
+import os
+import subprocess
+import sys
+
+from pyref.repomanager.manifest import MANIFEST_FILE_NAME
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+OLD_SOURCE = '''class Account:
+    def deposit(self, amount):
+        balance = self.balance + amount
+        self.history.append(amount)
+        self.balance = balance
+        return balance
+'''
+
+
+def _git(repo, *args):
+    subprocess.run(['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com', *args], cwd=repo, check=True,
+                   capture_output=True)
+
+
+def _write(repo, path, source):
+    os.makedirs(os.path.dirname(os.path.join(repo, path)), exist_ok=True)
+    with open(os.path.join(repo, path), 'w') as source_file:
+        source_file.write(source)
+
+
+def _pyref(*args):
+    environment = dict(os.environ, PYTHONPATH=PACKAGE_ROOT)
+    subprocess.run([sys.executable, '-m', 'pyref', *args], env=environment, check=True, capture_output=True)
+
+
+def _refactoring_locations(refactorings_dir):
+    locations = set()
+    for file_name in os.listdir(refactorings_dir):
+        if file_name != MANIFEST_FILE_NAME:
+            with open(os.path.join(refactorings_dir, file_name)) as refactorings_file:
+                refactorings = json.load(refactorings_file)['refactorings']
+            locations.update(refactoring['Location'] for refactoring in refactorings)
+    return locations
+
+
+def test_getrefs_directory_keeps_the_files_under_it(tmp_path):
+    repo = str(tmp_path / 'repo')
+    os.makedirs(repo)
+    _git(repo, 'init', '-q')
+    _write(repo, 'pkg/mod.py', OLD_SOURCE)
+    _write(repo, 'other/mod.py', OLD_SOURCE)
+    _git(repo, 'add', '.')
+    _git(repo, 'commit', '-q', '-m', 'initial')
+    _write(repo, 'pkg/mod.py', OLD_SOURCE.replace('deposit', 'credit'))
+    _write(repo, 'other/mod.py', OLD_SOURCE.replace('deposit', 'credit'))
+    _git(repo, 'commit', '-q', '-am', 'rename')
+
+    _pyref('repochanges', '-p', repo, '-a')
+    _pyref('getrefs', '-r', repo, '-o', str(tmp_path / 'all'))
+    _pyref('getrefs', '-r', repo, '-d', 'pkg', '-o', str(tmp_path / 'pkg'))
+
+    assert _refactoring_locations(str(tmp_path / 'all')) == {'pkg/mod.py/Account', 'other/mod.py/Account'}
+    assert _refactoring_locations(str(tmp_path / 'pkg')) == {'pkg/mod.py/Account'}